@@ -1,18 +1,51 @@
 # api.py
 
-from fastapi import FastAPI, HTTPException, Security, Depends
+from fastapi import FastAPI, HTTPException, Security, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from customer_support_agent import CustomerSupportAgent
+from langchain_core.messages import AIMessage
+from customer_support_agent import CustomerSupportAgent, MAX_TURNS
+from customer_database import COST_PER_TOKEN
+from semantic_cache import SemanticCache
+from batch_scheduler import BatchScheduler
 import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Enterprise Support AI API", version="2.0.0")
-agent = CustomerSupportAgent()
+semantic_cache = SemanticCache()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the agent (LLM client, DB seeding, graph build) in the background so /health answers immediately
+    app.state.agent_ready = asyncio.ensure_future(run_in_threadpool(CustomerSupportAgent))
+
+    async def run_batch(batch):
+        # DeepSeek has no multi-prompt completion, so the async graph runs overlap on the event loop
+        agent = await app.state.agent_ready
+        return await asyncio.gather(*[agent.asend_message(thread_id, message) for thread_id, message in batch],
+                                    return_exceptions=True)
+
+    app.state.batcher = BatchScheduler(run_batch, max_batch=8, max_wait_ms=5)
+    app.state.batcher.start()
+    yield
+    await app.state.batcher.stop()
+    semantic_cache.save()
+
+app = FastAPI(title="Enterprise Support AI API", version="2.0.0", lifespan=lifespan)
+
+async def get_agent(request: Request) -> CustomerSupportAgent:
+    """Process-wide agent singleton; waits for the warmup on the first requests."""
+    return await request.app.state.agent_ready
+
+# Replies that depend on live data or trigger side effects are never cached
+_UNCACHEABLE_AGENTS = {"order_specialist", "escalate"}
 
 # --- SECURITY ---
 security = HTTPBearer()
@@ -26,48 +59,138 @@ def validate_api_key(credentials: HTTPAuthorizationCredentials = Depends(securit
 # --- MODELS ---
 class ChatRequest(BaseModel):
     message: str
-    state: Optional[Dict[str, Any]] = None
+    thread_id: Optional[str] = None # omit to open a new conversation
 
 class ChatResponse(BaseModel):
     response: str
+    thread_id: str
     state: Dict[str, Any]
     analytics: Dict[str, Any]
 
+def _compile_analytics(state: Dict[str, Any]) -> Dict[str, Any]:
+    tokens = state.get("total_tokens", 0)
+    return {
+        "tokens": tokens,
+        "cost_usd": tokens * COST_PER_TOKEN,
+        "active_specialist": state.get("active_agent"),
+        "is_human_needed": state.get("is_human_takeover", False),
+        "customer_tier": state.get("customer_tier")
+    }
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+async def _load_thread(agent: CustomerSupportAgent, thread_id: Optional[str]):
+    """Server-side conversation state from the checkpointer; clients only hold the thread id."""
+    if not thread_id:
+        state = await run_in_threadpool(agent.start_conversation)
+        return state["conversation_id"], state
+    state = await agent.aget_state(thread_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Unknown thread_id")
+    return thread_id, state
+
 # --- ENDPOINTS ---
 @app.get("/")
 async def root():
     return RedirectResponse(url="/docs")
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest, token: str = Depends(validate_api_key)):
+async def chat_endpoint(request: ChatRequest, http_request: Request, token: str = Depends(validate_api_key),
+                        agent: CustomerSupportAgent = Depends(get_agent)):
     try:
         # 1. Initialize or Load State
-        state = request.state if request.state else agent.start_conversation()
+        thread_id, state = await _load_thread(agent, request.thread_id)
+        
+        # 2. Semantic Cache (skipped for paused sessions and messages carrying PII/identity)
+        scope = state.get("customer_id") or "GUEST"
+        embedding = None
+        if not state.get("is_human_takeover") and not agent.has_pii(request.message):
+            embedding = await run_in_threadpool(semantic_cache.embed, request.message)
+            cached = semantic_cache.lookup(scope, embedding)
+            if cached:
+                await agent.arecord_turn(thread_id, request.message, cached["response"], **cached["state_delta"])
+                state = await agent.aget_state(thread_id)
+                analytics = {**_compile_analytics(state), "tokens": 0, "cost_usd": 0.0, "cache_hit": True}
+                return ChatResponse(response=cached["response"], thread_id=thread_id, state=state, analytics=analytics)
         
-        # 2. Process Message
-        updated_state = agent.send_message(state, request.message)
+        # 3. Process Message
+        kept_turns = await run_in_threadpool(agent.truncate_history, thread_id, MAX_TURNS)
+        if state.get("is_human_takeover"):
+            # Paused sessions bypass batching so they are never grouped with live AI traffic
+            updated_state = await agent.asend_message(thread_id, request.message)
+        else:
+            updated_state = await http_request.app.state.batcher.submit(thread_id, request.message)
         
-        # 3. Extract Response
+        # 4. Extract Response
         last_msg = updated_state["messages"][-1]
-        content = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
+        if isinstance(last_msg, AIMessage):
+            content = agent.latest_reply(updated_state)
+        else:
+            content = last_msg.content if hasattr(last_msg, 'content') else str(last_msg)
         
-        # 4. Compile Analytics
-        analytics = {
-            "tokens": updated_state.get("total_tokens", 0),
-            "cost_usd": updated_state.get("total_tokens", 0) * 0.00000014,
-            "active_specialist": updated_state.get("active_agent"),
-            "is_human_needed": updated_state.get("is_human_takeover", False),
-            "customer_tier": updated_state.get("customer_tier")
-        }
+        # Fanned-out turns join several specialists' replies; cache only single-intent turns
+        intents = updated_state.get("intents") or []
+        if (isinstance(last_msg, AIMessage)
+                and updated_state.get("active_agent") not in _UNCACHEABLE_AGENTS
+                and len(intents) <= 1 and not _UNCACHEABLE_AGENTS.intersection(intents)
+                and not updated_state.get("is_human_takeover")
+                and (updated_state.get("customer_id") or "GUEST") == scope):
+            semantic_cache.add(scope, embedding, {"response": content,
+                                                  "state_delta": {"active_agent": updated_state.get("active_agent")}})
+        
+        # 5. Compile Analytics
+        analytics = {**_compile_analytics(updated_state), "kept_turns": kept_turns}
         
         return ChatResponse(
             response=content,
+            thread_id=thread_id,
             state=updated_state,
             analytics=analytics
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Engine Error: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, token: str = Depends(validate_api_key),
+                      agent: CustomerSupportAgent = Depends(get_agent)):
+    """Server-Sent Events: one `data` frame per specialist reply, then an `event: done` frame with analytics."""
+    # Resolve the thread before the 200 is committed so an unknown thread_id is a real 404
+    thread_id, _ = await _load_thread(agent, request.thread_id)
+
+    async def _gen():
+        try:
+            kept_turns = await run_in_threadpool(agent.truncate_history, thread_id, MAX_TURNS)
+            # Parallel specialists each produce their own frame
+            async for delta in agent.astream_message(thread_id, request.message):
+                for node, update in delta.items():
+                    msgs = (update or {}).get("messages")
+                    if msgs and isinstance(msgs[-1], AIMessage):
+                        yield _sse({"node": node, "delta": msgs[-1].content})
+            state = await agent.aget_state(thread_id)
+            yield _sse({**_compile_analytics(state), "thread_id": thread_id, "kept_turns": kept_turns}, event="done")
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield _sse({"detail": f"Engine Error: {str(e)}"}, event="error")
+
+    return StreamingResponse(_gen(), media_type="text/event-stream")
+
 @app.get("/health")
-async def health():
-    return {"status": "operational", "version": "2.0.0", "db": "WAL-Active"}
+async def health(request: Request):
+    ready = request.app.state.agent_ready
+    if not ready.done():
+        agent_status = "warming"
+    elif ready.cancelled():
+        # exception() would raise CancelledError here (e.g. warmup cancelled at shutdown)
+        agent_status = "failed"
+    else:
+        agent_status = "ready" if ready.exception() is None else "failed"
+    return {"status": "operational", "version": "2.0.0", "db": "WAL-Active", "agent": agent_status}
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools",
+                workers=int(os.getenv("API_WORKERS", os.cpu_count() or 1)), timeout_keep_alive=75)
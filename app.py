@@ -1,11 +1,13 @@
 # app.py
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 import time
 import os
-import re
+import threading
 from datetime import datetime
-from customer_support_agent import CustomerSupportAgent
+from customer_support_agent import CustomerSupportAgent, MAX_TURNS
+from customer_database import COST_PER_TOKEN
 from langchain_core.messages import HumanMessage, AIMessage
 
 # --- PAGE CONFIG ---
@@ -16,8 +18,25 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- AGENT WARMUP ---
+@st.cache_resource
+def load_agent():
+    return CustomerSupportAgent()
+
+@st.cache_resource
+def _start_warmup() -> threading.Thread:
+    """Builds the agent in the background (once per process) while the static page renders."""
+    warm = threading.Thread(target=load_agent, daemon=True)
+    add_script_run_ctx(warm)
+    warm.start()
+    return warm
+
+_start_warmup()
+
 # --- PREMIUM DESIGN SYSTEM (CSS) ---
-st.markdown("""
+@st.cache_data(ttl=86400)
+def _css() -> str:
+    return """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;600;700&family=Inter:wght@300;400;500;600&display=swap');
 
@@ -142,23 +161,31 @@ st.markdown("""
     .stChatMessage { animation: fadeIn 0.5s ease forwards; }
 
 </style>
-""", unsafe_allow_html=True)
+"""
 
-# --- INIT AGENT ---
-@st.cache_resource
-def load_agent():
-    return CustomerSupportAgent()
+st.markdown(_css(), unsafe_allow_html=True)
 
-agent = load_agent()
+@st.cache_data(ttl=86400)
+def _infrastructure_badges() -> str:
+    return """
+        <h4 style='color:#f8fafc; font-size:0.9rem; margin-top:2rem; margin-bottom:1rem;'>INFRASTRUCTURE</h4>
+        <div class="status-badge status-online" style="width:100%; margin-bottom:0.5rem;">Engine: DeepSeek-v3</div>
+        <div class="status-badge status-online" style="width:100%; margin-bottom:0.5rem;">DB: Postgres/WAL</div>
+        <div class="status-badge status-online" style="width:100%;">Security: AES-256 Masking</div>
+    """
 
-# --- SESSION STATE ---
-if "state" not in st.session_state:
-    st.session_state.state = None
-if "history" not in st.session_state:
-    st.session_state.history = []
+# --- MAIN CHAT INTERFACE ---
+st.markdown("""
+    <div style='margin-top: 2rem; margin-bottom: 2rem;'>
+        <h1 style='font-size: 2.5rem; margin-bottom: 0px;'>Enterprise Intelligence</h1>
+        <p style='color: #94a3b8; font-size: 1.1rem;'>Multi-Agent Orchestration & Support Terminal</p>
+    </div>
+""", unsafe_allow_html=True)
 
 # --- SIDEBAR (Premium Console) ---
-with st.sidebar:
+@st.fragment
+def _sidebar():
+    """Reads live state from the checkpointer so fragment-scoped reruns never see stale totals."""
     st.markdown("""
         <div class="sidebar-header">
             <h2 style='margin:0; color:#6366f1;'>PREMIUM</h2>
@@ -166,8 +193,9 @@ with st.sidebar:
         </div>
     """, unsafe_allow_html=True)
     
-    if st.session_state.state:
-        s = st.session_state.state
+    s = agent.get_state(st.session_state.thread_id)
+    if s:
+        tokens = s.get('total_tokens', 0)
         
         st.markdown("<h4 style='color:#f8fafc; font-size:0.9rem; margin-bottom:1rem;'>LIVE SESSION METRICS</h4>", unsafe_allow_html=True)
         
@@ -196,12 +224,12 @@ with st.sidebar:
             st.markdown(f"""
                 <div class="glass-card" style="text-align:center;">
                     <small style='color:#94a3b8;'>TOKENS</small><br/>
-                    <span style='color:#fff; font-weight:700;'>{int(s.get('total_tokens', 0))}</span>
+                    <span style='color:#fff; font-weight:700;'>{int(tokens)}</span>
                 </div>
             """, unsafe_allow_html=True)
 
         # Cost Analysis
-        cost = s.get('total_tokens', 0) * 0.00000014
+        cost = tokens * COST_PER_TOKEN
         st.markdown(f"""
             <div class="glass-card">
                 <div style='display:flex; justify-content:space-between;'>
@@ -214,47 +242,55 @@ with st.sidebar:
             </div>
         """, unsafe_allow_html=True)
         
-        st.markdown("<h4 style='color:#f8fafc; font-size:0.9rem; margin-top:2rem; margin-bottom:1rem;'>INFRASTRUCTURE</h4>", unsafe_allow_html=True)
-        st.markdown('<div class="status-badge status-online" style="width:100%; margin-bottom:0.5rem;">Engine: DeepSeek-v3</div>', unsafe_allow_html=True)
-        st.markdown('<div class="status-badge status-online" style="width:100%; margin-bottom:0.5rem;">DB: Postgres/WAL</div>', unsafe_allow_html=True)
-        st.markdown('<div class="status-badge status-online" style="width:100%;">Security: AES-256 Masking</div>', unsafe_allow_html=True)
+        st.markdown(_infrastructure_badges(), unsafe_allow_html=True)
 
     st.markdown("<div style='margin-top:2rem;'></div>", unsafe_allow_html=True)
     if st.button("RESET SESSION", use_container_width=True, type="secondary"):
-        st.session_state.state = None
+        st.session_state.thread_id = None
         st.session_state.history = []
+        # App-scoped: the chat pane has to clear too
         st.rerun()
 
-# --- MAIN CHAT INTERFACE ---
-st.markdown("""
-    <div style='margin-top: 2rem; margin-bottom: 2rem;'>
-        <h1 style='font-size: 2.5rem; margin-bottom: 0px;'>Enterprise Intelligence</h1>
-        <p style='color: #94a3b8; font-size: 1.1rem;'>Multi-Agent Orchestration & Support Terminal</p>
-    </div>
-""", unsafe_allow_html=True)
+# Takeover banner slot, filled once the session state is known
+banner = st.empty()
 
-# Auto-initialize
-if st.session_state.state is None:
-    st.session_state.state = agent.start_conversation()
-    greeting = st.session_state.state["messages"][-1].content
+# Display History (session-only, so it renders while the agent is still warming)
+if "history" not in st.session_state:
+    st.session_state.history = []
+for msg in st.session_state.history:
+    with st.chat_message(msg["role"]):
+        st.markdown(msg["content"])
+
+# --- INIT AGENT ---
+# First point that needs the agent: everything above rendered while the warmup thread built it
+agent = load_agent()
+
+# --- SESSION STATE ---
+# Graph state lives in the agent's checkpointer; the session only keeps the thread id and rendered chat
+if "thread_id" not in st.session_state:
+    st.session_state.thread_id = None
+
+# Auto-initialize before the sidebar so the first pass renders metrics and greeting together (no rerun)
+if st.session_state.thread_id is None:
+    initial = agent.start_conversation()
+    st.session_state.thread_id = initial["conversation_id"]
+    greeting = initial["messages"][-1].content
     st.session_state.history.append({"role": "assistant", "content": greeting})
+    with st.chat_message("assistant"):
+        st.markdown(greeting)
 
 # Human Takeover Logic
-if st.session_state.state.get("is_human_takeover"):
-    st.markdown("""
+paused = bool(agent.get_state(st.session_state.thread_id).get("is_human_takeover"))
+if paused:
+    banner.markdown("""
         <div style="background: rgba(239, 68, 68, 0.1); border: 1px solid rgba(239, 68, 68, 0.2); padding: 1.5rem; border-radius: 12px; color: #fca5a5; text-align: center; margin-bottom: 2rem;">
             <h3 style='margin:0; color:#ef4444;'>AI SESSION PAUSED</h3>
             <p style='margin:5px 0 0 0;'>A human specialist has joined the conversation. Input is disabled.</p>
         </div>
     """, unsafe_allow_html=True)
 
-# Display History
-for msg in st.session_state.history:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
-
 # Chat Input
-prompt = st.chat_input("Input command or query...", disabled=bool(st.session_state.state.get("is_human_takeover")))
+prompt = st.chat_input("Input command or query...", disabled=paused)
 
 if prompt:
     # Append User Message
@@ -266,17 +302,26 @@ if prompt:
     with st.chat_message("assistant"):
         placeholder = st.empty()
         full_response = ""
+        replies = []
         
-        # Stream from Graph
-        for delta in agent.stream_message(st.session_state.state, prompt):
-            for node, updated_state in delta.items():
-                st.session_state.state = updated_state
-                last_msg = updated_state["messages"][-1]
-                if isinstance(last_msg, AIMessage):
-                    full_response = last_msg.content
+        # Stream from Graph (history bounded to the last MAX_TURNS user turns);
+        # parallel specialists each add a reply
+        agent.truncate_history(st.session_state.thread_id, MAX_TURNS)
+        for delta in agent.stream_message(st.session_state.thread_id, prompt):
+            for node, update in delta.items():
+                msgs = (update or {}).get("messages")
+                if msgs and isinstance(msgs[-1], AIMessage):
+                    replies.append(msgs[-1].content)
+                    full_response = "\n\n".join(replies)
                     placeholder.markdown(full_response + " ▌")
         
         placeholder.markdown(full_response)
         st.session_state.history.append({"role": "assistant", "content": full_response})
     
-    st.rerun()
+    # The reply is already on screen; only rerun when escalation must lock the input
+    if agent.get_state(st.session_state.thread_id).get("is_human_takeover"):
+        st.rerun()
+
+# Sidebar renders last so its metrics already include this turn's tokens and cost
+with st.sidebar:
+    _sidebar()
@@ -0,0 +1,90 @@
+# batch_scheduler.py
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+# Setup logging
+logger = logging.getLogger("BatchScheduler")
+
+# Receives the argument tuples of one batch, returns one result (or exception) per item, in order
+BatchHandler = Callable[[List[Tuple[Any, ...]]], Awaitable[List[Any]]]
+
+class BatchScheduler:
+    """Dynamic micro-batcher: collects up to `max_batch` requests or `max_wait_ms`, then dispatches them together.
+
+    Batches are dispatched without waiting for the previous one to finish, bounded by
+    `max_batches_in_flight`, so one slow LLM call never holds up the queue.
+    """
+    def __init__(self, handler: BatchHandler, max_batch: int = 8, max_wait_ms: float = 5.0,
+                 max_batches_in_flight: int = 16):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batches_in_flight = max_batches_in_flight
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+        # Batch being collected by _loop and not yet handed to _dispatch
+        self._collecting: List[Tuple[Tuple[Any, ...], asyncio.Future]] = []
+
+    def start(self):
+        """Must be called from the running event loop (e.g. FastAPI lifespan)."""
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_batches_in_flight)
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stops collecting, fails every request not yet dispatched, then waits for in-flight batches."""
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+        stranded = self._collecting
+        self._collecting = []
+        while self._queue is not None and not self._queue.empty():
+            stranded.append(self._queue.get_nowait())
+        for _, fut in stranded:
+            if not fut.done():
+                fut.set_exception(RuntimeError("BatchScheduler stopped before dispatching this request"))
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    async def submit(self, *args: Any) -> Any:
+        if self._loop_task is None or self._loop_task.done():
+            raise RuntimeError("BatchScheduler is not running")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((args, fut))
+        return await fut
+
+    async def _loop(self):
+        while True:
+            batch = self._collecting = []
+            batch.append(await self._queue.get())
+            # Let the window fill unless a full batch is already waiting
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Tuple[Any, ...], asyncio.Future]]):
+        try:
+            results = await self.handler([args for args, _ in batch])
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} failed: {e}")
+            results = [e] * len(batch)
+        finally:
+            self._slots.release()
+        for (_, fut), result in zip(batch, results):
+            if fut.done():  # caller went away
+                continue
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
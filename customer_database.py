@@ -1,9 +1,10 @@
 # customer_database.py
 
 import sqlite3
-import json
+import orjson
 import logging
 import os
+import threading
 from datetime import datetime
 from typing import Optional, Dict, List, Any
 import operator
@@ -11,37 +12,126 @@ import operator
 # Setup logging
 logger = logging.getLogger("CustomerDatabase")
 
+# DeepSeek blended price per token (USD)
+COST_PER_TOKEN = 1.4e-7
+
+# --- SEED DATA ---
+CUSTOMER_ROWS = (
+    ('C1', 'Alice Johnson', 'alice@example.com', 'premium', 1250.50),
+    ('C2', 'Bob Smith', 'bob@example.com', 'standard', 45.00),
+)
+
+ORDER_ROWS = (
+    ('ORD-123', 'C1', 'Shipped', 'Wireless Headphones, USB-C Cable', '2026-01-30'),
+    ('ORD-456', 'C1', 'Processing', 'Smart Watch', '2026-02-05'),
+)
+
+def _zip_rows(cursor, rows) -> List[Dict]:
+    # Column names are read once per result set instead of once per row
+    keys = [d[0] for d in cursor.description]
+    return [dict(zip(keys, row)) for row in rows]
+
+def _is_postgres_url(db_url: str) -> bool:
+    return db_url.startswith("postgres://") or db_url.startswith("postgresql://")
+
+class SQLitePool:
+    """Single shared SQLite connection (WAL already set) guarded by a lock."""
+    def __init__(self, db_url: str):
+        self.conn = sqlite3.connect(db_url, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        self.lock.acquire()
+        try:
+            # Autocommit mode: open an explicit transaction so each borrow stays atomic
+            self.conn.execute("BEGIN")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def release(self, conn, commit: bool):
+        try:
+            if commit:
+                try:
+                    conn.commit()
+                except BaseException:
+                    # Never hand the next borrower an open transaction
+                    conn.rollback()
+                    raise
+            else:
+                conn.rollback()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.conn.close()
+
+class PostgresPool:
+    """Thin wrapper over psycopg2's ThreadedConnectionPool that blocks at capacity."""
+    def __init__(self, db_url: str, minconn: int = 1, maxconn: int = 16):
+        from psycopg2.pool import ThreadedConnectionPool
+        self.pool = ThreadedConnectionPool(minconn, maxconn, db_url)
+        # getconn() raises PoolError past maxconn instead of waiting, so callers queue here
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self.pool.getconn()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, commit: bool):
+        try:
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            try:
+                self.pool.putconn(conn)
+            finally:
+                self._slots.release()
+
+    def close(self):
+        self.pool.closeall()
+
+# One pool per database URL, shared by every CustomerDatabase/DBConnection in the process
+_POOLS: Dict[str, Any] = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(db_url: str):
+    """Returns the process-wide pool for `db_url`, creating it on first use."""
+    pool = _POOLS.get(db_url)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(db_url)
+            if pool is None:
+                pool = PostgresPool(db_url) if _is_postgres_url(db_url) else SQLitePool(db_url)
+                _POOLS[db_url] = pool
+    return pool
+
 class DBConnection:
-    """Context manager for SQLite and PostgreSQL with connection pooling logic."""
+    """Context manager that borrows a pooled SQLite/PostgreSQL connection."""
     def __init__(self, db_url: str):
         self.db_url = db_url
         self.conn = None
-        self.is_postgres = db_url.startswith("postgres://") or db_url.startswith("postgresql://")
+        self.is_postgres = _is_postgres_url(db_url)
+        self._pool = get_pool(db_url)
 
     def __enter__(self):
-        if self.is_postgres:
-            import psycopg2
-            from psycopg2.extras import RealDictCursor
-            self.conn = psycopg2.connect(self.db_url)
-            # Use RealDictCursor for compatibility with sqlite3.Row
-            return self.conn
-        else:
-            self.conn = sqlite3.connect(self.db_url, check_same_thread=False, timeout=30)
-            self.conn.row_factory = sqlite3.Row
-            self.conn.execute("PRAGMA journal_mode=WAL")
-            self.conn.execute("PRAGMA synchronous=NORMAL")
-            return self.conn
+        self.conn = self._pool.acquire()
+        return self.conn
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.conn:
-            if not self.is_postgres:
-                self.conn.commit()
-            else:
-                if exc_type is None:
-                    self.conn.commit()
-                else:
-                    self.conn.rollback()
-            self.conn.close()
+            self._pool.release(self.conn, commit=exc_type is None)
+            self.conn = None
 
 class CustomerDatabase:
     """Enhanced Customer Database with PostgreSQL support and BI-ready analytics."""
@@ -51,18 +141,66 @@ class CustomerDatabase:
         self.db_url = db_url or os.getenv("DATABASE_URL", "customers.db")
         self.is_postgres = self.db_url.startswith("postgres")
         self.placeholder = "%s" if self.is_postgres else "?"
+        # Dialect dispatch resolved once; RealDictCursor keeps rows dict-like like sqlite3.Row
+        if self.is_postgres:
+            import psycopg2.extras
+            self._cursor_factory = lambda conn: conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            self._rows_to_dicts = lambda cursor, rows: rows  # RealDictRow is already a dict
+        else:
+            self._cursor_factory = lambda conn: conn.cursor()
+            self._rows_to_dicts = _zip_rows
+        self.SQL = self._render_sql()
         self._create_tables()
         self._seed_data()
 
-    def _get_cursor(self, conn):
+    def _render_sql(self) -> Dict[str, str]:
+        """Parameterized statements rendered once for this dialect."""
+        ph = self.placeholder
         if self.is_postgres:
-            import psycopg2.extras
-            return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        return conn.cursor()
+            save_conversation = """
+                INSERT INTO conversations 
+                (conversation_id, customer_id, messages_json, resolved_status, 
+                 final_sentiment, final_priority, total_tokens, cost_estimate)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                messages_json = conversations.messages_json || EXCLUDED.messages_json,
+                end_time = CURRENT_TIMESTAMP,
+                resolved_status = EXCLUDED.resolved_status,
+                final_sentiment = EXCLUDED.final_sentiment,
+                final_priority = EXCLUDED.final_priority,
+                total_tokens = EXCLUDED.total_tokens,
+                cost_estimate = EXCLUDED.cost_estimate
+            """
+        else:
+            # save_conversation merges the stored array in Python inside the same transaction
+            save_conversation = """
+                INSERT INTO conversations 
+                (conversation_id, customer_id, messages_json, resolved_status, 
+                 final_sentiment, final_priority, total_tokens, cost_estimate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (conversation_id) DO UPDATE SET
+                messages_json = excluded.messages_json,
+                end_time = CURRENT_TIMESTAMP,
+                resolved_status = excluded.resolved_status,
+                final_sentiment = excluded.final_sentiment,
+                final_priority = excluded.final_priority,
+                total_tokens = excluded.total_tokens,
+                cost_estimate = excluded.cost_estimate
+            """
+        return {
+            "get_customer": f"SELECT * FROM customers WHERE email = {ph}",
+            "get_orders": f"SELECT * FROM orders WHERE customer_id = {ph}",
+            "insert_ticket": f"INSERT INTO tickets (ticket_id, customer_id, created_date, status, priority, category, description) VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})",
+            "save_conversation": save_conversation,
+            "get_conversation_messages": f"SELECT messages_json FROM conversations WHERE conversation_id = {ph}",
+            # ON CONFLICT DO NOTHING works on both Postgres and SQLite >= 3.24
+            "seed_customers": f"INSERT INTO customers VALUES ({ph}, {ph}, {ph}, {ph}, {ph}) ON CONFLICT DO NOTHING",
+            "seed_orders": f"INSERT INTO orders VALUES ({ph}, {ph}, {ph}, {ph}, {ph}) ON CONFLICT DO NOTHING",
+        }
 
     def _create_tables(self):
         with DBConnection(self.db_url) as conn:
-            cursor = self._get_cursor(conn)
+            cursor = self._cursor_factory(conn)
             
             # Decimal type in Postgres, Real/Float in SQLite
             numeric_type = "DECIMAL(10,2)" if self.is_postgres else "REAL"
@@ -120,82 +258,79 @@ class CustomerDatabase:
                 cost_estimate {numeric_type} DEFAULT 0.0
             )
             """)
+            
+            # 5. Indices for per-customer lookups (orders/tickets by customer_id)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tickets_customer ON tickets(customer_id)")
 
     def get_customer_by_email(self, email: str) -> Optional[Dict]:
         with DBConnection(self.db_url) as conn:
-            cursor = self._get_cursor(conn)
-            cursor.execute(f"SELECT * FROM customers WHERE email = {self.placeholder}", (email,))
+            cursor = self._cursor_factory(conn)
+            cursor.execute(self.SQL["get_customer"], (email,))
             row = cursor.fetchone()
             return dict(row) if row else None
 
     def get_customer_orders(self, customer_id: str) -> List[Dict]:
         with DBConnection(self.db_url) as conn:
-            cursor = self._get_cursor(conn)
-            cursor.execute(f"SELECT * FROM orders WHERE customer_id = {self.placeholder}", (customer_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            cursor = self._cursor_factory(conn)
+            cursor.execute(self.SQL["get_orders"], (customer_id,))
+            return self._rows_to_dicts(cursor, cursor.fetchall())
+
+    def get_customer_order_rows(self, customer_id: str) -> List[Any]:
+        """Fast path: raw driver rows (sqlite3.Row / RealDictRow), read by column name without copying."""
+        with DBConnection(self.db_url) as conn:
+            cursor = self._cursor_factory(conn)
+            cursor.execute(self.SQL["get_orders"], (customer_id,))
+            return cursor.fetchall()
 
     def create_ticket(self, customer_id: str, category: str, priority: str, description: str) -> str:
         ticket_id = f"TICK-{datetime.now().strftime('%y%m%d%H%M%S')}"
         with DBConnection(self.db_url) as conn:
-            cursor = self._get_cursor(conn)
+            cursor = self._cursor_factory(conn)
             cursor.execute(
-                f"INSERT INTO tickets (ticket_id, customer_id, created_date, status, priority, category, description) VALUES ({self.placeholder}, {self.placeholder}, {self.placeholder}, {self.placeholder}, {self.placeholder}, {self.placeholder}, {self.placeholder})",
+                self.SQL["insert_ticket"],
                 (ticket_id, customer_id, datetime.now(), "OPEN", priority, category, description)
             )
         return ticket_id
 
     def save_conversation(self, data: Dict):
-        """Saves session with analytics columns for BI tools."""
+        """Saves session with analytics columns for BI tools.
+
+        `messages` holds only the turns since the previous save; on an existing
+        conversation_id they are appended to the stored messages_json.
+        """
+        tokens = data.get('tokens', 0)
+        messages = data.get('messages', [])
         with DBConnection(self.db_url) as conn:
-            cursor = self._get_cursor(conn)
+            cursor = self._cursor_factory(conn)
+            if not self.is_postgres:
+                # The pooled borrow holds BEGIN + the pool lock, so read-merge-write is atomic
+                cursor.execute(self.SQL["get_conversation_messages"], (data['id'],))
+                row = cursor.fetchone()
+                if row is not None and row[0]:
+                    messages = orjson.loads(row[0]) + list(messages)
             
-            # Postgres upsert vs SQLite
-            if self.is_postgres:
-                sql = """
-                    INSERT INTO conversations 
-                    (conversation_id, customer_id, messages_json, resolved_status, 
-                     final_sentiment, final_priority, total_tokens, cost_estimate)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (conversation_id) DO UPDATE SET
-                    messages_json = EXCLUDED.messages_json,
-                    resolved_status = EXCLUDED.resolved_status,
-                    total_tokens = EXCLUDED.total_tokens,
-                    cost_estimate = EXCLUDED.cost_estimate
-                """
-            else:
-                sql = """
-                    INSERT OR REPLACE INTO conversations 
-                    (conversation_id, customer_id, messages_json, resolved_status, 
-                     final_sentiment, final_priority, total_tokens, cost_estimate)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                
-            cursor.execute(sql, (
+            cursor.execute(self.SQL["save_conversation"], (
                 data['id'],
                 data.get('customer_id', 'GUEST'),
-                json.dumps(data.get('messages', [])),
+                orjson.dumps(messages).decode(),
                 data.get('resolved', False),
                 data.get('sentiment', 'neutral'),
                 data.get('priority', 'medium'),
-                data.get('tokens', 0),
-                data.get('tokens', 0) * 0.00000014
+                tokens,
+                tokens * COST_PER_TOKEN
             ))
 
     def _seed_data(self):
         with DBConnection(self.db_url) as conn:
-            cursor = self._get_cursor(conn)
-            # Use universal seeding with placeholder abstraction
-            # Seed Customers
-            cursor.execute(f"INSERT INTO customers (customer_id, name, email, tier, total_spent) VALUES ({self.placeholder}, {self.placeholder}, {self.placeholder}, {self.placeholder}, {self.placeholder}) ON CONFLICT DO NOTHING", ('C1', 'Alice Johnson', 'alice@example.com', 'premium', 1250.50))
-            if not self.is_postgres: # SQLite specific ignore syntax handled by DBConnection if needed, but here we use manual
-                 cursor.execute("INSERT OR IGNORE INTO customers VALUES ('C1', 'Alice Johnson', 'alice@example.com', 'premium', 1250.50)")
-                 cursor.execute("INSERT OR IGNORE INTO customers VALUES ('C2', 'Bob Smith', 'bob@example.com', 'standard', 45.00)")
-                 cursor.execute("INSERT OR IGNORE INTO orders VALUES ('ORD-123', 'C1', 'Shipped', 'Wireless Headphones, USB-C Cable', '2026-01-30')")
-                 cursor.execute("INSERT OR IGNORE INTO orders VALUES ('ORD-456', 'C1', 'Processing', 'Smart Watch', '2026-02-05')")
-            else:
-                cursor.execute("INSERT INTO customers VALUES ('C1', 'Alice Johnson', 'alice@example.com', 'premium', 1250.50) ON CONFLICT DO NOTHING")
-                cursor.execute("INSERT INTO customers VALUES ('C2', 'Bob Smith', 'bob@example.com', 'standard', 45.00) ON CONFLICT DO NOTHING")
-                cursor.execute("INSERT INTO orders VALUES ('ORD-123', 'C1', 'Shipped', 'Wireless Headphones, USB-C Cable', '2026-01-30') ON CONFLICT DO NOTHING")
-                cursor.execute("INSERT INTO orders VALUES ('ORD-456', 'C1', 'Processing', 'Smart Watch', '2026-02-05') ON CONFLICT DO NOTHING")
+            cursor = self._cursor_factory(conn)
+            # Fast-path: skip seeding on repeat boots
+            cursor.execute("SELECT 1 FROM customers LIMIT 1")
+            if cursor.fetchone() is not None:
+                return
+            cursor.executemany(self.SQL["seed_customers"], CUSTOMER_ROWS)
+            cursor.executemany(self.SQL["seed_orders"], ORDER_ROWS)
+            # Refresh planner statistics so the new indices get picked
+            cursor.execute("ANALYZE")
             
             logger.info("Database seeding completed.")
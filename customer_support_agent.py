@@ -1,20 +1,27 @@
 # customer_support_agent.py
 
 import os
+import atexit
 import operator
 import logging
 import re
 import json
-from typing import TypedDict, Annotated, Sequence, Optional, Dict, Literal, List, Any
+import asyncio
+import threading
+from typing import TypedDict, Annotated, Optional, Dict, Literal, List, Any, Tuple
 from datetime import datetime
 from logging.handlers import TimedRotatingFileHandler
 
+import httpx
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
+from langgraph.graph.message import add_messages, REMOVE_ALL_MESSAGES
+from langgraph.types import Send
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, RemoveMessage
 from customer_database import CustomerDatabase
+from semantic_cache import LLMCache, SemanticCache
 
 # Load environment variables
 load_dotenv()
@@ -29,6 +36,90 @@ logger.setLevel(logging.INFO)
 logger.addHandler(file_handler)
 logger.addHandler(logging.StreamHandler())
 
+# --- SHARED HTTP CLIENTS ---
+# One keep-alive pool per process so TLS handshakes to the LLM API are amortized across requests
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=100, max_connections=200)
+http_client = httpx.Client(http2=True, limits=_HTTP_LIMITS)
+http_async_client = httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS)
+
+# --- PII PATTERNS ---
+# Compiled once at import; applied in order (cards/SSNs before the looser phone pattern)
+_EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+')
+_CARD_RE = re.compile(r'\b(?:\d{4}[\s-]?){3}\d{1,4}\b')
+_SSN_RE = re.compile(r'\b\d{3}-\d{2}-\d{4}\b')
+# Simple US phone pattern
+_PHONE_RE = re.compile(r'\+?\d{1,3}[\s-]?\(?\d{3}\)?[\s-]?\d{3}[\s-]?\d{4}')
+
+_PII_RES = [
+    (_EMAIL_RE, '[EMAIL_MASKED]'),
+    (_CARD_RE, '[CARD_MASKED]'),
+    (_SSN_RE, '[SSN_MASKED]'),
+    (_PHONE_RE, '[PHONE_MASKED]'),
+]
+
+# Joins messages for a single scrubbing sweep; NUL is neither \s nor \w, so no pattern can match across it
+_PII_SEP = "\x00"
+
+# --- TOKEN ACCOUNTING ---
+# Fixed per-turn overhead (framing + reply) on top of the user message itself
+_TURN_OVERHEAD_TOKENS = 100
+# Sliding window of user turns sent through the graph
+MAX_TURNS = 12
+
+_encoding = None
+
+def _load_encoding():
+    """Loads the tiktoken BPE (Rust core, may download its vocab) off the request path.
+
+    Called at import and again by each agent init while it is still missing, so a failed
+    download is retried instead of cached; until then counts fall back to a word estimate.
+    """
+    global _encoding
+    if _encoding is not None:
+        return
+    try:
+        import tiktoken
+        _encoding = tiktoken.encoding_for_model("gpt-4")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, using word-count token estimate: {e}")
+
+_load_encoding()
+
+def _count_tokens(text: str) -> int:
+    enc = _encoding
+    if enc is None:
+        return len(text.split()) * 2
+    return len(enc.encode(text, disallowed_special=()))
+
+def _count_tokens_batch(texts: List[str]) -> List[int]:
+    enc = _encoding
+    if enc is None:
+        return [len(t.split()) * 2 for t in texts]
+    # encode_batch fans out across threads inside the Rust core
+    return [len(ids) for ids in enc.encode_batch(texts, disallowed_special=())]
+
+# --- KNOWLEDGE BASE ---
+_TECH_KB = {
+    "password": "Go to login -> Forgot Password.",
+    "login": "Ensure cookies are enabled and try Incognito mode."
+}
+_TECH_FALLBACK = "Please describe your technical issue in more detail."
+# Billing requests that always go to a human
+_BILLING_ESCALATE_WORDS = frozenset({"refund", "charge", "dispute"})
+
+def _build_kb_automaton():
+    """Aho-Corasick automaton over the KB keywords (one pass per query); None if pyahocorasick is missing."""
+    try:
+        import ahocorasick
+    except ImportError:
+        logger.warning("pyahocorasick unavailable, using linear KB scan.")
+        return None
+    automaton = ahocorasick.Automaton()
+    for rank, (keyword, answer) in enumerate(_TECH_KB.items()):
+        automaton.add_word(keyword, (rank, answer))
+    automaton.make_automaton()
+    return automaton
+
 # --- MULTI-VENDOR LLM FALLBACK ---
 class DualModelProvider:
     """Enterprise-ready LLM provider with automatic fallback."""
@@ -38,7 +129,9 @@ class DualModelProvider:
             model="deepseek-chat",
             openai_api_key=os.getenv("DEEPSEEK_API_KEY"),
             openai_api_base="https://api.deepseek.com/v1",
-            max_tokens=2000
+            max_tokens=2000,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
         # Secondary: Could be OpenAI, Gemini, etc. For now generic fallback logic.
         self.secondary = self.primary # Mocking secondary as the same for this environment
@@ -51,18 +144,88 @@ class DualModelProvider:
             return self.secondary.invoke(prompt)
 
     def with_structured_output(self, schema: Any):
-        # We wrap the underlying primary's structured output function
-        return self.primary.with_structured_output(schema)
+        # Runnable fallbacks cover both invoke and ainvoke, so the async router keeps the secondary
+        return self.primary.with_structured_output(schema).with_fallbacks(
+            [self.secondary.with_structured_output(schema)])
 
 llm_provider = DualModelProvider()
 
+# --- SYNC BRIDGE ---
+# Every graph run happens on one long-lived loop: pooled connections of the shared AsyncClient
+# and the checkpointer's connection are bound to it. Sync callers (Streamlit, threadpool workers)
+# block on it; async callers on another loop (FastAPI) await it.
+_bridge_loop: Optional[asyncio.AbstractEventLoop] = None
+_bridge_lock = threading.Lock()
+
+def _new_loop() -> asyncio.AbstractEventLoop:
+    # uvicorn only applies uvloop to its own server loop; the hot path runs here
+    try:
+        import uvloop
+        return uvloop.new_event_loop()
+    except ImportError:
+        logger.warning("uvloop unavailable, running the agent loop on stock asyncio.")
+        return asyncio.new_event_loop()
+
+def _get_bridge_loop() -> asyncio.AbstractEventLoop:
+    global _bridge_loop
+    with _bridge_lock:
+        if _bridge_loop is None:
+            _bridge_loop = _new_loop()
+            threading.Thread(target=_bridge_loop.run_forever, name="agent-loop", daemon=True).start()
+    return _bridge_loop
+
+def _run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _get_bridge_loop()).result()
+
+async def _on_bridge(coro):
+    loop = _get_bridge_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+async def _anext(agen):
+    return await agen.__anext__()
+
+# --- CONVERSATION CHECKPOINTS ---
+AGENT_STATE_DB = os.getenv("AGENT_STATE_DB", "agent_state.db")
+
+async def _open_checkpointer(path: str):
+    """Graph state per thread_id in SQLite; process-local memory if langgraph-checkpoint-sqlite is missing."""
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError as e:
+        logger.warning(f"SQLite checkpointer unavailable, conversation state is in-memory only: {e}")
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+    # Shared by every API worker: WAL + busy timeout, as SQLitePool does for customers.db
+    conn = await aiosqlite.connect(path, timeout=30)
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    return saver
+
 # --- SCHEMAS ---
+Specialist = Literal["order_specialist", "tech_specialist", "billing_specialist"]
+
 class RouterDecision(BaseModel):
     next_agent: Literal["order_specialist", "tech_specialist", "billing_specialist", "general_support", "escalate", "end"]
     reasoning: str
+    intents: List[Specialist] = Field(default_factory=list, description="Every specialist needed when the message mixes several issues")
+
+# Router labels -> graph nodes
+_ROUTES = {
+    "order_specialist": "order_agent",
+    "tech_specialist": "tech_agent",
+    "billing_specialist": "billing_agent",
+    "general_support": "general_agent",
+    "escalate": "escalate",
+    "end": END
+}
 
 class CustomerSupportState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], add_messages]
     customer_id: Optional[str]
     customer_name: Optional[str]
     customer_tier: str
@@ -73,23 +236,44 @@ class CustomerSupportState(TypedDict):
     ticket_id: Optional[str]
     current_step: str
     customer_sentiment: str
-    total_tokens: int
+    total_tokens: Annotated[int, operator.add] # each turn contributes its own count
+    intents: List[str] # specialists flagged by the router for a multi-intent turn
+    conversation_id: Optional[str]
+    last_saved_idx: int # messages before this index are already persisted
 
 # --- CORE AGENT ---
 class CustomerSupportAgent:
-    def __init__(self, db_path: str = "customers.db"):
+    def __init__(self, db_path: str = "customers.db", state_path: str = AGENT_STATE_DB):
         self.db = CustomerDatabase(db_path)
+        _load_encoding()
+        # Opened on the bridge loop, which runs every graph invocation
+        self.checkpointer = _run_sync(_open_checkpointer(state_path))
         self.graph = self._build_graph()
         self.router_chain = llm_provider.with_structured_output(RouterDecision)
+        # Router decisions depend only on the routed message, so near-duplicates can share one
+        self.router_cache = LLMCache(llm_provider.primary.model_name,
+                                     semantic=SemanticCache(threshold=0.9, path="router_cache.json"),
+                                     ttl=3600, scope="router")
+        atexit.register(self.router_cache.semantic.save)
+        self.stats = {"router_cache_hits": 0, "router_cache_misses": 0}
+        self._kb_ac = _build_kb_automaton()
 
     def _scrub_pii(self, text: str) -> str:
-        """Security: PII Scrubbing (Email/Phone/SSN masking)."""
-        # Mask emails
-        text = re.sub(r'[\w\.-]+@[\w\.-]+', '[EMAIL_MASKED]', text)
-        # Mask phone numbers (simple US pattern)
-        text = re.sub(r'\+?\d{1,3}[\s-]?\(?\d{3}\)?[\s-]?\d{3}[\s-]?\d{4}', '[PHONE_MASKED]', text)
+        """Security: PII Scrubbing (Email/Card/SSN/Phone masking)."""
+        for pattern, mask in _PII_RES:
+            text = pattern.sub(mask, text)
         return text
 
+    def _scrub_pii_batch(self, texts: List[str]) -> List[str]:
+        """Scrubs many messages with one sweep per pattern over the joined transcript."""
+        scrubbed = self._scrub_pii(_PII_SEP.join(texts)).split(_PII_SEP)
+        if len(scrubbed) != len(texts):  # content already contained the separator
+            return [self._scrub_pii(t) for t in texts]
+        return scrubbed
+
+    def has_pii(self, text: str) -> bool:
+        return self._scrub_pii(text) != text
+
     def _build_graph(self):
         workflow = StateGraph(CustomerSupportState)
         
@@ -106,18 +290,7 @@ class CustomerSupportAgent:
         workflow.set_entry_point("identify")
         workflow.add_edge("identify", "supervisor")
         
-        workflow.add_conditional_edges(
-            "supervisor",
-            lambda x: x["active_agent"],
-            {
-                "order_specialist": "order_agent",
-                "tech_specialist": "tech_agent",
-                "billing_specialist": "billing_agent",
-                "general_support": "general_agent",
-                "escalate": "escalate",
-                "end": END
-            }
-        )
+        workflow.add_conditional_edges("supervisor", self._parallel_dispatch, _ROUTES)
         
         # Specialists should END the turn to wait for user input
         for agent in ["order_agent", "tech_agent", "billing_agent", "general_agent"]:
@@ -125,32 +298,70 @@ class CustomerSupportAgent:
             
         workflow.add_edge("escalate", END)
         
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
+
+    def _parallel_dispatch(self, state: CustomerSupportState):
+        """Routes to one specialist, or fans out to several at once (Send) for multi-intent turns."""
+        active = state["active_agent"]
+        intents = list(dict.fromkeys(state.get("intents") or []))
+        if active not in ("escalate", "end") and len(intents) > 1:
+            return [Send(_ROUTES[i], state) for i in intents if i in _ROUTES]
+        return active
 
     # --- NODES ---
-    def _identify_node(self, state: CustomerSupportState) -> CustomerSupportState:
-        if state.get("customer_id"): return state
+    async def _identify_node(self, state: CustomerSupportState) -> CustomerSupportState:
+        if state.get("customer_id"): return {}
         last_msg = state["messages"][-1].content if state["messages"] else ""
-        match = re.search(r'[\w\.-]+@[\w\.-]+', last_msg)
+        match = _EMAIL_RE.search(last_msg)
         if match:
-            customer = self.db.get_customer_by_email(match.group())
+            customer = await asyncio.to_thread(self.db.get_customer_by_email, match.group())
             if customer:
                 logger.info(f"Identified customer: {customer['name']} ({customer['tier']})")
-                return {**state, "customer_id": customer["customer_id"], "customer_name": customer["name"], "customer_tier": customer["tier"]}
-        return state
+                return {"customer_id": customer["customer_id"], "customer_name": customer["name"], "customer_tier": customer["tier"]}
+        return {}
+
+    def _trim_messages(self, messages: List[BaseMessage], max_tokens: int = 6000) -> List[BaseMessage]:
+        """Keep the newest messages that fit 90% of `max_tokens` (10% safety buffer).
 
-    def _trim_messages(self, messages: List[BaseMessage], max_messages: int = 10) -> List[BaseMessage]:
-        """Keep the last N messages to prevent context window overflow."""
-        if len(messages) <= max_messages:
+        Leading SystemMessages and the first user message are always kept; when anything is
+        dropped a `[Context Summary]` marker takes its place and the kept tail starts on a user turn.
+        """
+        messages = list(messages)
+        counts = _count_tokens_batch([m.content if isinstance(m.content, str) else str(m.content) for m in messages])
+        budget = int(max_tokens * 0.9)
+        if sum(counts) <= budget:
             return messages
-        # Always keep the first message if it's a SystemMessage
-        if isinstance(messages[0], SystemMessage):
-            return [messages[0]] + list(messages[-(max_messages-1):])
-        return list(messages[-max_messages:])
 
-    def _supervisor_node(self, state: CustomerSupportState) -> CustomerSupportState:
+        n_head = 0
+        while n_head < len(messages) and isinstance(messages[n_head], SystemMessage):
+            n_head += 1
+        first_user = next((i for i in range(n_head, len(messages)) if isinstance(messages[i], HumanMessage)), None)
+        pinned = list(range(n_head)) + ([first_user] if first_user is not None else [])
+        rest = [i for i in range(n_head, len(messages)) if i != first_user]
+
+        remaining = budget - sum(counts[i] for i in pinned)
+        tail: List[int] = []
+        for i in reversed(rest):
+            if counts[i] > remaining:
+                break
+            remaining -= counts[i]
+            tail.append(i)
+        tail.reverse()
+        # Start the window on a user turn so replies are never orphaned from their question
+        while tail and not isinstance(messages[tail[0]], HumanMessage):
+            tail.pop(0)
+
+        # Report dropped user turns (Human/AI exchanges), not individual messages
+        kept = set(tail)
+        dropped = sum(1 for i in rest if i not in kept and isinstance(messages[i], HumanMessage))
+        trimmed = [messages[i] for i in pinned]
+        if dropped:
+            trimmed.append(SystemMessage(content=f"[Context Summary] {dropped} earlier turns omitted"))
+        return trimmed + [messages[i] for i in tail]
+
+    async def _supervisor_node(self, state: CustomerSupportState) -> CustomerSupportState:
         # UX: If human takeover is active, immediately end AI involvement
-        if state.get("is_human_takeover"): return {**state, "active_agent": "end"}
+        if state.get("is_human_takeover"): return {"active_agent": "end", "intents": []}
         
         # Identify messages
         messages = state["messages"]
@@ -158,51 +369,63 @@ class CustomerSupportAgent:
         
         # Safety: If we just spoke, wait for user
         if isinstance(last_message, AIMessage):
-            return {**state, "active_agent": "end"}
+            return {"active_agent": "end", "intents": []}
             
         prompt = f"Supervisor: Decide specialist based on: {last_message.content}"
+        # Keyed on the user's words alone so the shared template does not inflate similarity
+        cached, embedding = await self.router_cache.get(last_message.content)
+        if cached:
+            self.stats["router_cache_hits"] += 1
+            decision = RouterDecision(**cached)
+            return {"active_agent": decision.next_agent, "intents": decision.intents}
+        self.stats["router_cache_misses"] += 1
         try:
-            decision = self.router_chain.invoke(prompt)
-            return {**state, "active_agent": decision.next_agent}
+            decision = await self.router_chain.ainvoke(prompt)
+            await self.router_cache.set(last_message.content, decision.model_dump(), embedding)
+            return {"active_agent": decision.next_agent, "intents": decision.intents}
         except Exception as e:
             logger.error(f"Routing error: {e}")
-            return {**state, "active_agent": "general_support"}
+            # intents persist across turns, so clear them or the last turn's fan-out repeats
+            return {"active_agent": "general_support", "intents": []}
 
-    def _order_agent_node(self, state: CustomerSupportState) -> CustomerSupportState:
+    async def _order_agent_node(self, state: CustomerSupportState) -> CustomerSupportState:
         if not state.get("customer_id"):
-            return {**state, "messages": [AIMessage(content="I can help with orders! Please provide your email.")]}
-        orders = self.db.get_customer_orders(state["customer_id"])
+            return {"messages": [AIMessage(content="I can help with orders! Please provide your email.")]}
+        orders = await asyncio.to_thread(self.db.get_customer_order_rows, state["customer_id"])
         if not orders:
             resp = "I found no active orders in your history."
         else:
             ord = orders[0]
             resp = f"Your latest order {ord['order_id']} ({ord['items']}) is currently {ord['status']}."
-        return {**state, "messages": [AIMessage(content=resp + "\nAnything else?")]}
+        return {"messages": [AIMessage(content=resp + "\nAnything else?")]}
 
-    def _tech_agent_node(self, state: CustomerSupportState) -> CustomerSupportState:
+    async def _tech_agent_node(self, state: CustomerSupportState) -> CustomerSupportState:
         """Grounded Tech Support Specialist."""
         query = state["messages"][-1].content.lower()
-        kb = {
-            "password": "Go to login -> Forgot Password.",
-            "login": "Ensure cookies are enabled and try Incognito mode."
-        }
-        match = next((v for k, v in kb.items() if k in query), "Please describe your technical issue in more detail.")
-        return {**state, "messages": [AIMessage(content=f"Tech Specialist: {match}\nDid that help?")]}
+        if self._kb_ac is not None:
+            # Earliest KB entry wins when several keywords appear, as with the linear scan
+            hit = min((payload for _, payload in self._kb_ac.iter(query)), default=None)
+            match = hit[1] if hit else _TECH_FALLBACK
+        else:
+            match = next((v for k, v in _TECH_KB.items() if k in query), _TECH_FALLBACK)
+        return {"messages": [AIMessage(content=f"Tech Specialist: {match}\nDid that help?")]}
 
-    def _billing_agent_node(self, state: CustomerSupportState) -> CustomerSupportState:
+    async def _billing_agent_node(self, state: CustomerSupportState) -> CustomerSupportState:
         msg = state["messages"][-1].content.lower()
-        if any(w in msg for w in ["refund", "charge", "dispute"]):
-            return {**state, "active_agent": "escalate"}
-        return {**state, "messages": [AIMessage(content="Billing Specialist here. All your payments are up to date!")]}
+        if any(w in msg for w in _BILLING_ESCALATE_WORDS):
+            return {"active_agent": "escalate"}
+        return {"messages": [AIMessage(content="Billing Specialist here. All your payments are up to date!")]}
 
-    def _general_support_node(self, state: CustomerSupportState) -> CustomerSupportState:
-        return {**state, "messages": [AIMessage(content="Generalist here. How can I help you?")]}
+    async def _general_support_node(self, state: CustomerSupportState) -> CustomerSupportState:
+        return {"messages": [AIMessage(content="Generalist here. How can I help you?")]}
 
-    def _escalation_node(self, state: CustomerSupportState) -> CustomerSupportState:
-        # BI: Save conversation with detailed analytics before ending
-        masked_msgs = [self._scrub_pii(m.content) for m in state["messages"]]
+    async def _escalation_node(self, state: CustomerSupportState) -> CustomerSupportState:
+        # BI: Save conversation with detailed analytics before ending (only turns not yet persisted)
+        saved_idx = state.get("last_saved_idx", 0)
+        masked_msgs = self._scrub_pii_batch([m.content for m in state["messages"][saved_idx:]])
+        session_id = state.get("conversation_id") or f"SESS-{datetime.now().timestamp()}"
         session_data = {
-            "id": f"SESS-{datetime.now().timestamp()}",
+            "id": session_id,
             "customer_id": state.get("customer_id"),
             "messages": masked_msgs,
             "resolved": True,
@@ -210,28 +433,137 @@ class CustomerSupportAgent:
             "priority": "high",
             "tokens": state.get("total_tokens", 0)
         }
-        self.db.save_conversation(session_data)
+        await asyncio.to_thread(self.db.save_conversation, session_data)
         
-        tid = self.db.create_ticket(state.get("customer_id", "GUEST"), "General", "High", "Auto-escalated.")
-        return {**state, "messages": [AIMessage(content=f"ESCALATION: A human will help you. Ticket #{tid}. AI is now paused.")], "is_human_takeover": True}
+        tid = await asyncio.to_thread(self.db.create_ticket, state.get("customer_id", "GUEST"), "General", "High", "Auto-escalated.")
+        return {"messages": [AIMessage(content=f"ESCALATION: A human will help you. Ticket #{tid}. AI is now paused.")], "is_human_takeover": True,
+                "conversation_id": session_id, "last_saved_idx": len(state["messages"])}
+
+    def _summarize_history(self, messages: List[BaseMessage], summarize: bool) -> Tuple[str, int]:
+        """Returns the leading context note for dropped turns and the tokens spent producing it."""
+        note = f"[Context Summary] {sum(isinstance(m, HumanMessage) for m in messages)} earlier turns omitted."
+        if not summarize:
+            return note, 0
+        transcript = "\n".join(f"{m.type}: {m.content}" for m in self._trim_messages(messages))
+        prompt = f"Summarize the following conversation in 3 bullets:\n{transcript}"
+        try:
+            res = llm_provider.invoke(prompt)
+            return f"[Context Summary]\n{res.content}", _count_tokens(prompt) + _count_tokens(res.content)
+        except Exception as e:
+            logger.warning(f"History summarization failed: {e}")
+            return note, 0
 
     # --- PUBLIC API ---
+    @staticmethod
+    def _config(thread_id: str) -> dict:
+        return {"configurable": {"thread_id": thread_id}}
+
+    async def aget_state(self, thread_id: str) -> dict:
+        snapshot = await _on_bridge(self.graph.aget_state(self._config(thread_id)))
+        return snapshot.values
+
+    def get_state(self, thread_id: str) -> dict:
+        return _run_sync(self.aget_state(thread_id))
+
+    async def aupdate_state(self, thread_id: str, values: dict):
+        """Writes outside a graph run, applied through the reducers as if it were turn input."""
+        await _on_bridge(self.graph.aupdate_state(self._config(thread_id), values, as_node=START))
+
+    def update_state(self, thread_id: str, values: dict):
+        _run_sync(self.aupdate_state(thread_id, values))
+
+    async def arecord_turn(self, thread_id: str, message: str, reply: str, **values):
+        """Appends an exchange answered outside the graph (e.g. a cached reply) to the thread."""
+        await self.aupdate_state(thread_id, {"messages": [HumanMessage(content=self._scrub_pii(message)),
+                                                          AIMessage(content=reply)], **values})
+
+    def truncate_history(self, thread_id: str, keep_turns: int = MAX_TURNS, summarize_older: bool = False) -> int:
+        """Sliding window, run just before a new user turn: keep the last `keep_turns - 1` user
+        turns so the window holds `keep_turns` once the incoming turn is appended.
+
+        Only fires once the history reaches twice the window. Older turns not yet persisted are
+        flushed to the DB first and replaced by a leading `[Context Summary]` note; with
+        `summarize_older` the note is an LLM summary whose tokens are added to `total_tokens`.
+        Returns the number of user turns in the window, counting the incoming one.
+        """
+        state = self.get_state(thread_id)
+        messages = list(state["messages"])
+        human_idx = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        keep = max(keep_turns - 1, 0)
+        if len(human_idx) + 1 < 2 * keep_turns or keep >= len(human_idx):
+            return len(human_idx) + 1
+        cut = human_idx[-keep] if keep else len(messages)
+        saved_idx = state.get("last_saved_idx", 0)
+        if saved_idx < cut:
+            self.db.save_conversation({
+                "id": state.get("conversation_id") or thread_id,
+                "customer_id": state.get("customer_id"),
+                "messages": self._scrub_pii_batch([m.content for m in messages[saved_idx:cut]]),
+                "resolved": False,
+                "sentiment": state.get("customer_sentiment", "neutral"),
+                "tokens": state.get("total_tokens", 0)
+            })
+        summary_text, summary_tokens = self._summarize_history(messages[:cut], summarize_older)
+        self.update_state(thread_id, {
+            "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), SystemMessage(content=summary_text)] + messages[cut:],
+            "total_tokens": summary_tokens,
+            # The summary itself is never persisted; it sits before the saved index
+            "last_saved_idx": 1 + max(0, saved_idx - cut)
+        })
+        return keep + 1
+
     def start_conversation(self) -> dict:
-        return {"messages": [AIMessage(content="Welcome to Enterprise Support. How can I help today?")], 
+        """Opens a thread (keyed by `conversation_id`) and returns its initial state."""
+        state = {"messages": [AIMessage(content="Welcome to Enterprise Support. How can I help today?")], 
                 "customer_id": None, "customer_name": None, "customer_tier": "standard", "active_agent": "supervisor", 
-                "resolved": False, "requires_escalation": False, "is_human_takeover": False, "total_tokens": 0}
+                "resolved": False, "requires_escalation": False, "is_human_takeover": False, "total_tokens": 0, "intents": [],
+                "conversation_id": f"SESS-{datetime.now().timestamp()}", "last_saved_idx": 0}
+        self.update_state(state["conversation_id"], state)
+        return state
+
+    def latest_reply(self, state: dict) -> str:
+        """All AI replies since the last user message (several when specialists ran in parallel)."""
+        replies = []
+        for m in reversed(state["messages"]):
+            if isinstance(m, HumanMessage):
+                break
+            if isinstance(m, AIMessage):
+                replies.append(m.content)
+        return "\n\n".join(reversed(replies))
 
-    def send_message(self, state: dict, message: str) -> dict:
+    def _turn_input(self, message: str) -> dict:
         # PII Scrubbing on ingestion for input security
         safe_msg = self._scrub_pii(message)
-        state["messages"].append(HumanMessage(content=safe_msg))
-        # Estimate tokens
-        state["total_tokens"] = state.get("total_tokens", 0) + (len(safe_msg.split()) * 2 + 100)
-        return self.graph.invoke(state)
+        # Count tokens (added onto the thread's running total by the reducer)
+        return {"messages": [HumanMessage(content=safe_msg)],
+                "total_tokens": _count_tokens(safe_msg) + _TURN_OVERHEAD_TOKENS}
 
-    def stream_message(self, state: dict, message: str):
-        safe_msg = self._scrub_pii(message)
-        state["messages"].append(HumanMessage(content=safe_msg))
-        state["total_tokens"] = state.get("total_tokens", 0) + (len(safe_msg.split()) * 2 + 100)
-        for output in self.graph.stream(state):
-            yield output
+    async def asend_message(self, thread_id: str, message: str) -> dict:
+        """Runs one turn on the thread; the checkpointer supplies the rest of the state."""
+        return await _on_bridge(self.graph.ainvoke(self._turn_input(message), self._config(thread_id)))
+
+    async def astream_message(self, thread_id: str, message: str):
+        """Yields `{node: update}` as each node finishes; read the final state with `aget_state`."""
+        agen = self.graph.astream(self._turn_input(message), self._config(thread_id), stream_mode="updates")
+        try:
+            while True:
+                try:
+                    yield await _on_bridge(_anext(agen))
+                except StopAsyncIteration:
+                    break
+        finally:
+            await _on_bridge(agen.aclose())
+
+    def send_message(self, thread_id: str, message: str) -> dict:
+        return _run_sync(self.asend_message(thread_id, message))
+
+    def stream_message(self, thread_id: str, message: str):
+        agen = self.graph.astream(self._turn_input(message), self._config(thread_id), stream_mode="updates")
+        try:
+            while True:
+                try:
+                    yield _run_sync(_anext(agen))
+                except StopAsyncIteration:
+                    break
+        finally:
+            _run_sync(agen.aclose())
@@ -0,0 +1,298 @@
+# dashboard_core.py
+
+import asyncio
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from customer_database import DBConnection, CustomerDatabase
+import os
+from datetime import datetime, timedelta
+
+# --- PREMIUM DESIGN SYSTEM ---
+# Registered once per process at import (on the main thread, before any figure worker runs):
+# plotly_dark on transparent cards with the enterprise palette
+pio.templates["enterprise"] = go.layout.Template(pio.templates["plotly_dark"])
+pio.templates["enterprise"].layout.update(
+    paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
+    colorway=['#6366f1', '#10b981', '#f43f5e', '#8b5cf6', '#d946ef']
+)
+pio.templates.default = "enterprise"
+
+SENTIMENT_COLORS = {'positive': '#10b981', 'neutral': '#6366f1', 'negative': '#f43f5e'}
+PRIORITY_COLORS = {'low': '#6366f1', 'medium': '#8b5cf6', 'high': '#d946ef'}
+
+def inject_css():
+    st.markdown("""
+<style>
+    @import url('https://fonts.googleapis.com/css2?family=Outfit:wght@300;400;600;700&family=Inter:wght@300;400;500;600&display=swap');
+
+    :root {
+        --primary: #6366f1;
+        --secondary: #10b981;
+        --accent: #f43f5e;
+        --bg: #0b0f1a;
+        --card-bg: rgba(30, 41, 59, 0.5);
+        --border: rgba(255, 255, 255, 0.1);
+    }
+
+    .stApp {
+        background: radial-gradient(circle at top right, #1e1b4b, #0b0f1a);
+        font-family: 'Inter', sans-serif;
+        color: #f8fafc;
+    }
+
+    h1, h2, h3 {
+        font-family: 'Outfit', sans-serif;
+        letter-spacing: -0.02em;
+    }
+
+    .glass-card {
+        background: var(--card-bg);
+        backdrop-filter: blur(16px);
+        -webkit-backdrop-filter: blur(16px);
+        border: 1px solid var(--border);
+        border-radius: 20px;
+        padding: 1.5rem;
+        margin-bottom: 1.5rem;
+    }
+
+    .kpi-value {
+        font-size: 2.2rem;
+        font-weight: 700;
+        color: white;
+        margin: 0.5rem 0;
+    }
+
+    .kpi-label {
+        font-size: 0.75rem;
+        text-transform: uppercase;
+        letter-spacing: 0.1em;
+        color: #94a3b8;
+    }
+
+    /* Table Customization */
+    .stDataFrame {
+        background: var(--card-bg) !important;
+        border: 1px solid var(--border) !important;
+        border-radius: 12px !important;
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# --- DATA LAYER ---
+@st.cache_resource
+def get_db() -> CustomerDatabase:
+    """One database handle (and its connection pool) per process, not per rerun."""
+    return CustomerDatabase()
+
+def db_version(db: CustomerDatabase):
+    """Freshness token for the cache key: SQLite file + WAL mtimes (None for Postgres; TTL covers it)."""
+    if db.is_postgres:
+        return None
+    paths = [db.db_url, f"{db.db_url}-wal"]
+    return max((os.path.getmtime(p) for p in paths if os.path.exists(p)), default=None)
+
+# Aggregates are computed by the database so only a handful of rows cross into Python
+KPI_SQL = """
+    SELECT COUNT(*), SUM(CASE WHEN resolved_status THEN 1 ELSE 0 END),
+           AVG(total_tokens), SUM(cost_estimate)
+    FROM conversations
+"""
+SENTIMENT_SQL = "SELECT final_sentiment, COUNT(*) AS count FROM conversations GROUP BY final_sentiment"
+WORKLOAD_SQL = "SELECT final_priority, COUNT(*) AS count FROM conversations GROUP BY final_priority ORDER BY count DESC"
+TOP_SESSIONS_SQL = """
+    SELECT customer_id, final_priority, total_tokens, cost_estimate
+    FROM conversations ORDER BY total_tokens DESC LIMIT 5
+"""
+TREND_SQL = {
+    "sqlite": "SELECT strftime('%Y-%m-%d %H:00', start_time) AS bucket, SUM(total_tokens) AS total_tokens "
+              "FROM conversations GROUP BY bucket ORDER BY bucket",
+    "postgres": "SELECT to_char(date_trunc('hour', start_time), 'YYYY-MM-DD HH24:00') AS bucket, "
+                "SUM(total_tokens) AS total_tokens FROM conversations GROUP BY bucket ORDER BY bucket",
+}
+
+# Synthetic padding for demos only; production dashboards show real telemetry
+DASHBOARD_DEMO = os.getenv("DASHBOARD_DEMO") == "1"
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _mock_df() -> pd.DataFrame:
+    return pd.DataFrame({
+        'conversation_id': [f'X-{i}' for i in range(15)],
+        'customer_id': ['C1', 'C2', 'GUEST'] * 5,
+        'start_time': [datetime.now() - timedelta(minutes=15*i) for i in range(15)],
+        'resolved_status': [1, 1, 0] * 5,
+        'final_sentiment': ['positive', 'neutral', 'negative'] * 5,
+        'final_priority': ['low', 'medium', 'high'] * 5,
+        'total_tokens': [400, 300, 800] * 5,
+        'cost_estimate': [0.00005, 0.00004, 0.0001] * 5
+    })
+
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """Low-cardinality labels as categoricals, metrics as 32-bit numbers."""
+    for c in ('final_sentiment', 'final_priority', 'customer_id'):
+        if c in df:
+            df[c] = df[c].astype('category')
+    if 'total_tokens' in df:
+        df['total_tokens'] = pd.to_numeric(df['total_tokens'], downcast='integer')
+    if 'cost_estimate' in df:
+        df['cost_estimate'] = df['cost_estimate'].astype('float32')
+    return df
+
+def _summarize(df: pd.DataFrame) -> dict:
+    """Pandas twin of the SQL aggregates, used for the small padded demo frame."""
+    df = df.assign(bucket=pd.to_datetime(df['start_time']).dt.strftime('%Y-%m-%d %H:00'))
+    agg = df.agg({'resolved_status': 'sum', 'total_tokens': 'mean', 'cost_estimate': 'sum'})
+    return {
+        "kpis": {
+            "volume": len(df),
+            "resolved": int(agg['resolved_status']),
+            "avg_tokens": float(agg['total_tokens']),
+            "total_cost": float(agg['cost_estimate']),
+        },
+        "trend": df.groupby('bucket', as_index=False)['total_tokens'].sum(),
+        "sentiment": df['final_sentiment'].value_counts().reset_index(),
+        "workload": df['final_priority'].value_counts().reset_index(),
+        "top_sessions": df.sort_values('total_tokens', ascending=False).head(5)[
+            ['customer_id', 'final_priority', 'total_tokens', 'cost_estimate']],
+    }
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_data(db_url: str, db_version, is_postgres: bool = False):
+    """Returns the dashboard aggregates, or None before the first conversation is logged."""
+    with DBConnection(db_url) as conn:
+        cursor = conn.cursor()
+        cursor.execute(KPI_SQL)
+        volume, resolved, avg_tokens, total_cost = cursor.fetchone()
+        if not volume:
+            return None
+        # Demo mode: pad sparse data with synthetic sessions so every chart has variety
+        if DASHBOARD_DEMO and volume < 10:
+            df = pd.read_sql_query("SELECT * FROM conversations", conn)
+            df['start_time'] = pd.to_datetime(df['start_time'])
+            return _summarize(_downcast(pd.concat([df, _mock_df()], ignore_index=True)))
+        return {
+            "kpis": {"volume": volume, "resolved": int(resolved or 0),
+                     "avg_tokens": float(avg_tokens or 0), "total_cost": float(total_cost or 0)},
+            "trend": pd.read_sql_query(TREND_SQL["postgres" if is_postgres else "sqlite"], conn),
+            "sentiment": pd.read_sql_query(SENTIMENT_SQL, conn),
+            "workload": pd.read_sql_query(WORKLOAD_SQL, conn),
+            "top_sessions": _downcast(pd.read_sql_query(TOP_SESSIONS_SQL, conn)),
+        }
+
+# --- HEADER ---
+def render_header():
+    st.markdown("""
+<div style='display:flex; justify-content:space-between; align-items:center; margin-bottom:2rem;'>
+    <div>
+        <h1 style='margin:0; font-size:2.8rem;'>Command Center</h1>
+        <p style='color:#94a3b8; margin:0;'>AI Agent Performance & Strategic Analytics</p>
+    </div>
+    <div class="glass-card" style='padding:0.75rem 1.5rem; margin:0; display:flex; gap:2rem;'>
+        <div style='text-align:center;'>
+            <small style='display:block; color:#94a3b8;'>STATUS</small>
+            <b style='color:#10b981;'>● OPERATIONAL</b>
+        </div>
+        <div style='text-align:center;'>
+            <small style='display:block; color:#94a3b8;'>UPTIME</small>
+            <b style='color:white;'>99.98%</b>
+        </div>
+    </div>
+</div>
+""", unsafe_allow_html=True)
+
+# --- KPI GRID ---
+def render_kpis(kpis: dict):
+    k_col1, k_col2, k_col3, k_col4 = st.columns(4)
+
+    with k_col1:
+        st.markdown(f"""<div class="glass-card">
+        <p class="kpi-label">Volume</p>
+        <p class="kpi-value">{kpis['volume']}</p>
+        <small style='color:#10b981;'>↑ 12% vs last week</small>
+    </div>""", unsafe_allow_html=True)
+
+    with k_col2:
+        res_rate = (kpis['resolved'] / kpis['volume']) * 100
+        st.markdown(f"""<div class="glass-card">
+        <p class="kpi-label">Resolution</p>
+        <p class="kpi-value">{res_rate:.1f}%</p>
+        <small style='color:#10b981;'>↑ 4% efficiency</small>
+    </div>""", unsafe_allow_html=True)
+
+    with k_col3:
+        avg_t = kpis['avg_tokens']
+        st.markdown(f"""<div class="glass-card">
+        <p class="kpi-label">Avg Complexity</p>
+        <p class="kpi-value">{int(avg_t)}</p>
+        <small style='color:#94a3b8;'>Tokens per session</small>
+    </div>""", unsafe_allow_html=True)
+
+    with k_col4:
+        cost = kpis['total_cost']
+        st.markdown(f"""<div class="glass-card">
+        <p class="kpi-label">Total Burn</p>
+        <p class="kpi-value">${cost:.4f}</p>
+        <small style='color:#f43f5e;'>Cost awareness active</small>
+    </div>""", unsafe_allow_html=True)
+
+# --- CHARTS ---
+def _trend_figure(trend: pd.DataFrame):
+    fig = px.area(trend, x='bucket', y='total_tokens')
+    fig.update_layout(margin=dict(l=0, r=0, t=20, b=0), height=350)
+    return fig
+
+def _sentiment_figure(sentiment: pd.DataFrame):
+    fig = px.pie(sentiment, names='final_sentiment', values='count', hole=0.7,
+                 color='final_sentiment', color_discrete_map=SENTIMENT_COLORS)
+    fig.update_layout(margin=dict(l=0, r=0, t=20, b=0), height=350, showlegend=False)
+    # Add center text
+    fig.add_annotation(text="CSAT", x=0.5, y=0.5, font_size=20, showarrow=False, font_color="white")
+    return fig
+
+def _workload_figure(workload: pd.DataFrame):
+    fig = px.bar(workload, x='count', y='final_priority', orientation='h',
+                 color='final_priority', color_discrete_map=PRIORITY_COLORS)
+    fig.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=300)
+    return fig
+
+async def _build_figures(data: dict):
+    """Builds the three charts on worker threads so their construction overlaps."""
+    return await asyncio.gather(
+        asyncio.to_thread(_trend_figure, data['trend']),
+        asyncio.to_thread(_sentiment_figure, data['sentiment']),
+        asyncio.to_thread(_workload_figure, data['workload']),
+    )
+
+def render_charts(data: dict):
+    trend_fig, sentiment_fig, workload_fig = asyncio.run(_build_figures(data))
+
+    row1_1, row1_2 = st.columns([2, 1])
+
+    with row1_1:
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.write("### Resource Utilization Trend")
+        st.plotly_chart(trend_fig, use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with row1_2:
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.write("### Sentiment Analysis")
+        st.plotly_chart(sentiment_fig, use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    row2_1, row2_2 = st.columns([1, 1])
+
+    with row2_1:
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.write("### Specialist Workload Matrix")
+        st.plotly_chart(workload_fig, use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with row2_2:
+        st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+        st.write("### High Intensity Sessions")
+        st.dataframe(data['top_sessions'],
+                    use_container_width=True, hide_index=True)
+        st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,258 @@
+# semantic_cache.py
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Any, Protocol, Tuple, Callable
+
+import numpy as np
+
+# Setup logging
+logger = logging.getLogger("SemanticCache")
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+# Encoders are shared by every cache in the process (the model is ~90MB)
+_ENCODERS: Dict[str, Any] = {}
+_ENCODERS_LOCK = threading.Lock()
+
+def _get_encoder(model_name: str):
+    with _ENCODERS_LOCK:
+        if model_name not in _ENCODERS:
+            from sentence_transformers import SentenceTransformer
+            _ENCODERS[model_name] = SentenceTransformer(model_name)
+        return _ENCODERS[model_name]
+
+def _expired(entry: Dict[str, Any]) -> bool:
+    # Entries without `expires_at` (e.g. reply caches) never expire
+    return entry.get("expires_at", float("inf")) <= time.time()
+
+class SemanticCache:
+    """Nearest-neighbour reply cache over normalized prompt embeddings (FAISS inner product).
+
+    Entries are partitioned by scope (e.g. customer id) so a hit never crosses sessions
+    that could see different answers. A full scope drops expired entries, then the oldest
+    tenth. Degrades to a no-op if faiss or sentence-transformers is not installed.
+    """
+    def __init__(self, threshold: float = 0.9, path: Optional[str] = None,
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2", max_entries: int = 10000):
+        self.threshold = threshold
+        self.path = path or os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.json")
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.enabled = True
+        self.stats = {"hits": 0, "misses": 0}
+        self._encoder = None
+        self._indexes: Dict[str, Any] = {}
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._vectors: Dict[str, List[List[float]]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def _new_index(self, dim: int):
+        import faiss
+        return faiss.IndexFlatIP(dim)
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Returns a (1, dim) float32 unit vector, or None if the cache is disabled."""
+        if not self.enabled:
+            return None
+        if self._encoder is None:
+            try:
+                import faiss  # noqa: F401
+                self._encoder = _get_encoder(self.model_name)
+            except ImportError as e:
+                logger.warning(f"Semantic cache disabled: {e}")
+                self.enabled = False
+                return None
+        return self._encoder.encode([_normalize(text)], normalize_embeddings=True).astype("float32")
+
+    def lookup(self, scope: str, embedding: Optional[np.ndarray],
+               accept: Optional[Callable[[Dict[str, Any]], bool]] = None, k: int = 4) -> Optional[Dict[str, Any]]:
+        """Closest entry above the threshold; `accept` can reject candidates (e.g. expired ones)."""
+        if embedding is None:
+            return None
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None or index.ntotal == 0:
+                self.stats["misses"] += 1
+                return None
+            sims, ids = index.search(embedding, min(k, index.ntotal))
+            for sim, idx in zip(sims[0], ids[0]):
+                if sim < self.threshold:
+                    break
+                entry = self._entries[scope][idx]
+                if accept is None or accept(entry):
+                    self.stats["hits"] += 1
+                    return entry
+            self.stats["misses"] += 1
+            return None
+
+    def _compact(self, scope: str, drop_oldest: int = 0):
+        """Drops expired entries plus the `drop_oldest` oldest live ones, rebuilding the index. Caller holds the lock."""
+        entries, vectors = self._entries[scope], self._vectors[scope]
+        keep = [i for i, e in enumerate(entries) if not _expired(e)][drop_oldest:]
+        if len(keep) == len(entries):
+            return
+        self._entries[scope] = [entries[i] for i in keep]
+        self._vectors[scope] = [vectors[i] for i in keep]
+        index = self._new_index(len(vectors[0]))
+        if keep:
+            index.add(np.asarray(self._vectors[scope], dtype="float32"))
+        self._indexes[scope] = index
+
+    def add(self, scope: str, embedding: Optional[np.ndarray], entry: Dict[str, Any]):
+        if embedding is None:
+            return
+        with self._lock:
+            if len(self._entries.get(scope, [])) >= self.max_entries:
+                self._compact(scope)
+            if len(self._entries.get(scope, [])) >= self.max_entries:
+                # Evict in chunks so the O(n) rebuild is paid once per tenth of the capacity
+                self._compact(scope, drop_oldest=max(1, self.max_entries // 10))
+            if scope not in self._indexes:
+                self._indexes[scope] = self._new_index(embedding.shape[1])
+                self._entries[scope] = []
+                self._vectors[scope] = []
+            self._indexes[scope].add(embedding)
+            self._entries[scope].append(entry)
+            self._vectors[scope].append(embedding[0].tolist())
+
+    def save(self):
+        with self._lock:
+            if not self._entries:
+                return
+            payload = {}
+            for scope, entries in self._entries.items():
+                live = [i for i, e in enumerate(entries) if not _expired(e)]
+                if live:
+                    payload[scope] = {"vectors": [self._vectors[scope][i] for i in live],
+                                      "entries": [entries[i] for i in live]}
+            with open(self.path, "w") as f:
+                json.dump(payload, f)
+        logger.info(f"Semantic cache persisted to {self.path}.")
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                payload = json.load(f)
+            for scope, data in payload.items():
+                live = [i for i, e in enumerate(data["entries"]) if not _expired(e)]
+                if not live:
+                    continue
+                kept_vectors = [data["vectors"][i] for i in live]
+                vectors = np.asarray(kept_vectors, dtype="float32")
+                index = self._new_index(vectors.shape[1])
+                index.add(vectors)
+                self._indexes[scope] = index
+                self._entries[scope] = [data["entries"][i] for i in live]
+                self._vectors[scope] = kept_vectors
+        except ImportError as e:
+            logger.warning(f"Semantic cache disabled: {e}")
+            self.enabled = False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable semantic cache {self.path}: {e}")
+
+# --- STRUCTURED LLM OUTPUT CACHE ---
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+    async def set(self, key: str, value: Dict[str, Any], ttl: int) -> None: ...
+
+class InMemoryBackend:
+    """Process-local LRU with per-entry expiry."""
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+class RedisBackend:
+    """Shared exact-match cache across workers (requires `redis`)."""
+    def __init__(self, url: str, prefix: str = "llmcache:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        await self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+def default_backend() -> CacheBackend:
+    url = os.getenv("REDIS_URL")
+    if url:
+        try:
+            return RedisBackend(url)
+        except ImportError as e:
+            logger.warning(f"REDIS_URL set but redis is unavailable ({e}); using in-memory cache.")
+    return InMemoryBackend()
+
+class LLMCache:
+    """Exact (sha256 of model + normalized prompt) then semantic cache for structured LLM outputs.
+
+    Cache failures are logged and treated as misses; they never fail the LLM call path.
+    """
+    def __init__(self, model: str, backend: Optional[CacheBackend] = None,
+                 semantic: Optional[SemanticCache] = None, ttl: int = 3600, scope: str = "llm"):
+        self.model = model
+        self.backend = backend or default_backend()
+        self.semantic = semantic
+        self.ttl = ttl
+        self.scope = scope
+
+    def key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.model}:{_normalize(prompt)}".encode()).hexdigest()
+
+    async def get(self, prompt: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """Returns (value, embedding); pass the embedding back to `set` on a miss to avoid re-encoding."""
+        embedding = None
+        try:
+            value = await self.backend.get(self.key(prompt))
+            if value is not None:
+                return value, None
+            if self.semantic is not None:
+                embedding = await asyncio.to_thread(self.semantic.embed, prompt)
+                entry = self.semantic.lookup(self.scope, embedding,
+                                             accept=lambda e: e.get("expires_at", 0) > time.time())
+                if entry is not None:
+                    return entry["value"], embedding
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+        return None, embedding
+
+    async def set(self, prompt: str, value: Dict[str, Any], embedding: Any = None):
+        try:
+            await self.backend.set(self.key(prompt), value, self.ttl)
+            if self.semantic is not None:
+                if embedding is None:
+                    embedding = await asyncio.to_thread(self.semantic.embed, prompt)
+                # Near-duplicate hits honour the same TTL as exact ones
+                self.semantic.add(self.scope, embedding, {"value": value, "expires_at": time.time() + self.ttl})
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
@@ -0,0 +1,11 @@
+# tests/conftest.py
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The agent module logs and caches relative to the working directory; keep that out of the tree
+os.chdir(tempfile.mkdtemp(prefix="support-agent-tests-"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test-key")
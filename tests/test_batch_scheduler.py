@@ -0,0 +1,89 @@
+# tests/test_batch_scheduler.py
+
+import asyncio
+
+import pytest
+
+from batch_scheduler import BatchScheduler
+
+def _run(coro):
+    return asyncio.run(coro)
+
+def test_results_follow_submission_order():
+    batches = []
+
+    async def handler(items):
+        batches.append([a for a, in items])
+        # Later items finish first; results must still line up with their callers
+        await asyncio.sleep(0.01 * (3 - len(batches) % 3))
+        return [a * 10 for a, in items]
+
+    async def main():
+        scheduler = BatchScheduler(handler, max_batch=3, max_wait_ms=20)
+        scheduler.start()
+        try:
+            return await asyncio.gather(*(scheduler.submit(i) for i in range(7)))
+        finally:
+            await scheduler.stop()
+
+    assert _run(main()) == [i * 10 for i in range(7)]
+    assert all(len(b) <= 3 for b in batches)
+    assert sorted(i for b in batches for i in b) == list(range(7))
+
+def test_per_item_exception_only_fails_that_caller():
+    async def handler(items):
+        return [ValueError(a) if a == "bad" else a.upper() for a, in items]
+
+    async def main():
+        scheduler = BatchScheduler(handler, max_batch=4, max_wait_ms=20)
+        scheduler.start()
+        try:
+            return await asyncio.gather(scheduler.submit("ok"), scheduler.submit("bad"),
+                                        scheduler.submit("fine"), return_exceptions=True)
+        finally:
+            await scheduler.stop()
+
+    ok, bad, fine = _run(main())
+    assert (ok, fine) == ("OK", "FINE")
+    assert isinstance(bad, ValueError)
+
+def test_handler_failure_propagates_to_every_caller():
+    async def handler(items):
+        raise RuntimeError("backend down")
+
+    async def main():
+        scheduler = BatchScheduler(handler, max_batch=4, max_wait_ms=20)
+        scheduler.start()
+        try:
+            return await asyncio.gather(*(scheduler.submit(i) for i in range(3)), return_exceptions=True)
+        finally:
+            await scheduler.stop()
+
+    results = _run(main())
+    assert all(isinstance(r, RuntimeError) and str(r) == "backend down" for r in results)
+
+def test_stop_fails_undispatched_requests():
+    async def main():
+        gate = asyncio.Event()
+
+        async def handler(items):
+            await gate.wait()
+            return [a for a, in items]
+
+        scheduler = BatchScheduler(handler, max_batch=1, max_wait_ms=0, max_batches_in_flight=1)
+        scheduler.start()
+        calls = [asyncio.create_task(scheduler.submit(i)) for i in range(4)]
+        await asyncio.sleep(0.05)
+        stopping = asyncio.create_task(scheduler.stop())
+        await asyncio.sleep(0.01)
+        gate.set()
+        await stopping
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), timeout=1)
+        with pytest.raises(RuntimeError):
+            await scheduler.submit(99)
+        return results
+
+    results = _run(main())
+    # The in-flight batch completes; everything still queued is failed instead of hanging
+    assert results[0] == 0
+    assert all(isinstance(r, RuntimeError) for r in results[1:])
@@ -0,0 +1,149 @@
+# tests/test_customer_database.py
+
+import sqlite3
+import sys
+import threading
+import time
+import types
+
+import orjson
+import pytest
+
+from customer_database import CustomerDatabase, DBConnection, PostgresPool, get_pool
+
+@pytest.fixture
+def db(tmp_path):
+    return CustomerDatabase(str(tmp_path / "customers.db"))
+
+def _stored_messages(db, conversation_id):
+    with DBConnection(db.db_url) as conn:
+        row = conn.execute("SELECT messages_json FROM conversations WHERE conversation_id = ?",
+                           (conversation_id,)).fetchone()
+    return orjson.loads(row[0])
+
+def test_save_conversation_appends_in_order(db):
+    db.save_conversation({"id": "S1", "messages": ["m0", {"role": "user", "content": "m1"}]})
+    db.save_conversation({"id": "S1", "messages": []})
+    db.save_conversation({"id": "S1", "messages": [f"m{i}" for i in range(2, 40)], "tokens": 7})
+
+    assert _stored_messages(db, "S1") == ["m0", {"role": "user", "content": "m1"}] + [f"m{i}" for i in range(2, 40)]
+
+def test_concurrent_appends_are_not_lost(db):
+    def writer(n):
+        for i in range(10):
+            db.save_conversation({"id": "S2", "messages": [f"{n}-{i}"]})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stored = _stored_messages(db, "S2")
+    assert sorted(stored) == sorted(f"{n}-{i}" for n in range(4) for i in range(10))
+    # Each writer's own messages keep their relative order
+    for n in range(4):
+        assert [m for m in stored if m.startswith(f"{n}-")] == [f"{n}-{i}" for i in range(10)]
+
+def test_sqlite_borrow_rolls_back_on_error(db):
+    with pytest.raises(sqlite3.OperationalError):
+        with DBConnection(db.db_url) as conn:
+            conn.execute("INSERT INTO tickets (ticket_id) VALUES ('T-ROLLBACK')")
+            conn.execute("SELECT * FROM missing_table")
+
+    with DBConnection(db.db_url) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM tickets WHERE ticket_id = 'T-ROLLBACK'").fetchone()[0] == 0
+        assert conn.in_transaction  # the next borrow still starts its own transaction
+
+def test_get_pool_is_shared_per_url(tmp_path):
+    url = str(tmp_path / "shared.db")
+    assert get_pool(url) is get_pool(url)
+
+class _FakeThreadedPool:
+    """Mimics psycopg2: getconn() raises instead of waiting once maxconn are checked out."""
+    def __init__(self, minconn, maxconn, dsn):
+        self.maxconn = maxconn
+        self.out = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            if self.out >= self.maxconn:
+                raise RuntimeError("connection pool exhausted")
+            self.out += 1
+            self.peak = max(self.peak, self.out)
+        return types.SimpleNamespace(commit=lambda: None, rollback=lambda: None)
+
+    def putconn(self, conn):
+        with self._lock:
+            self.out -= 1
+
+    def closeall(self):
+        pass
+
+@pytest.fixture
+def fake_psycopg2(monkeypatch):
+    pool_module = types.ModuleType("psycopg2.pool")
+    pool_module.ThreadedConnectionPool = _FakeThreadedPool
+    package = types.ModuleType("psycopg2")
+    package.pool = pool_module
+    monkeypatch.setitem(sys.modules, "psycopg2", package)
+    monkeypatch.setitem(sys.modules, "psycopg2.pool", pool_module)
+
+def test_postgres_pool_blocks_at_capacity(fake_psycopg2):
+    pool = PostgresPool("postgresql://test", minconn=1, maxconn=2)
+    held = [pool.acquire(), pool.acquire()]
+    acquired = threading.Event()
+
+    def borrower():
+        conn = pool.acquire()
+        acquired.set()
+        pool.release(conn, commit=True)
+
+    t = threading.Thread(target=borrower)
+    t.start()
+    time.sleep(0.1)
+    assert not acquired.is_set()  # waiting, not raising PoolError
+
+    pool.release(held.pop(), commit=True)
+    assert acquired.wait(timeout=2)
+    t.join()
+    pool.release(held.pop(), commit=False)
+    assert pool.pool.out == 0
+
+def test_postgres_pool_under_contention_never_exceeds_maxconn(fake_psycopg2):
+    pool = PostgresPool("postgresql://test", minconn=1, maxconn=3)
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(20):
+                conn = pool.acquire()
+                time.sleep(0.001)
+                pool.release(conn, commit=True)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert pool.pool.peak <= 3
+
+def test_postgres_pool_frees_slot_when_getconn_fails(fake_psycopg2):
+    pool = PostgresPool("postgresql://test", minconn=1, maxconn=1)
+    getconn = pool.pool.getconn
+
+    def failing_getconn():
+        raise OSError("server gone")
+
+    pool.pool.getconn = failing_getconn
+    with pytest.raises(OSError):
+        pool.acquire()
+    pool.pool.getconn = getconn
+    # The failed attempt did not leak the only slot
+    pool.release(pool.acquire(), commit=True)
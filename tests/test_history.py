@@ -0,0 +1,84 @@
+# tests/test_history.py
+
+import orjson
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from customer_database import DBConnection
+from customer_support_agent import CustomerSupportAgent, RouterDecision
+
+class _KeywordRouter:
+    """Offline stand-in for the structured-output router chain."""
+    async def ainvoke(self, prompt):
+        text = prompt.lower()
+        if "human" in text:
+            return RouterDecision(next_agent="escalate", reasoning="asked for a person")
+        return RouterDecision(next_agent="tech_specialist", reasoning="tech", intents=["tech_specialist"])
+
+@pytest.fixture(scope="module")
+def agent(tmp_path_factory):
+    root = tmp_path_factory.mktemp("agent")
+    agent = CustomerSupportAgent(str(root / "customers.db"), state_path=str(root / "state.db"))
+    agent.router_chain = _KeywordRouter()
+    return agent
+
+def _persisted(agent, conversation_id):
+    with DBConnection(agent.db.db_url) as conn:
+        row = conn.execute("SELECT messages_json FROM conversations WHERE conversation_id = ?",
+                           (conversation_id,)).fetchone()
+    return orjson.loads(row[0]) if row else []
+
+def _long_history(turns, words=50):
+    messages = [SystemMessage(content="instructions"), AIMessage(content="welcome")]
+    for i in range(turns):
+        messages += [HumanMessage(content=f"question {i} " + "q " * words),
+                     AIMessage(content=f"answer {i} " + "a " * words)]
+    return messages
+
+def test_trim_keeps_everything_under_budget(agent):
+    messages = _long_history(3, words=5)
+    assert agent._trim_messages(messages, max_tokens=6000) == messages
+
+def test_trim_pins_head_and_reports_dropped_turns(agent):
+    messages = _long_history(30)
+    trimmed = agent._trim_messages(messages, max_tokens=1000)
+
+    assert trimmed[0].content == "instructions"
+    assert trimmed[1].content.startswith("question 0 ")
+    marker = trimmed[2]
+    assert isinstance(marker, SystemMessage)
+    tail = trimmed[3:]
+    assert isinstance(tail[0], HumanMessage)
+    kept_turns = sum(isinstance(m, HumanMessage) for m in tail)
+    # One turn is pinned, the rest of the 30 are either kept or counted as omitted turns
+    assert marker.content == f"[Context Summary] {30 - 1 - kept_turns} earlier turns omitted"
+    assert tail[-1].content == messages[-1].content
+
+def test_truncate_window_counts_the_incoming_turn(agent):
+    thread_id = agent.start_conversation()["conversation_id"]
+    reported = []
+    for i in range(8):
+        reported.append(agent.truncate_history(thread_id, keep_turns=3))
+        state = agent.send_message(thread_id, f"login fails {i}")
+        human_turns = sum(isinstance(m, HumanMessage) for m in state["messages"])
+        assert reported[-1] == human_turns
+    assert max(reported) == 5 and reported[-1] <= 5
+    assert state["messages"][0].content == "[Context Summary] 3 earlier turns omitted."
+
+def test_no_duplicate_messages_after_truncate_then_persist(agent):
+    start = agent.start_conversation()
+    thread_id = start["conversation_id"]
+    transcript = [start["messages"][0].content]
+    for i in range(9):
+        agent.truncate_history(thread_id, keep_turns=2)
+        state = agent.send_message(thread_id, f"login fails {i}")
+        transcript += [f"login fails {i}", agent.latest_reply(state)]
+
+    agent.truncate_history(thread_id, keep_turns=2)
+    state = agent.send_message(thread_id, "let me talk to a human")
+    assert state["is_human_takeover"]
+
+    stored = _persisted(agent, thread_id)
+    # Every message is persisted exactly once, in order; the escalation notice and summaries are not
+    assert stored == transcript + ["let me talk to a human"]
+    assert not any(m.startswith("[Context Summary]") for m in stored)
@@ -0,0 +1,135 @@
+# tests/test_semantic_cache.py
+
+import asyncio
+import json
+import sys
+import time
+import types
+
+import numpy as np
+import pytest
+
+import semantic_cache
+from semantic_cache import InMemoryBackend, LLMCache, SemanticCache
+
+class _FlatIP:
+    """numpy stand-in for faiss.IndexFlatIP."""
+    def __init__(self, dim):
+        self.vectors = np.zeros((0, dim), dtype="float32")
+
+    @property
+    def ntotal(self):
+        return len(self.vectors)
+
+    def add(self, x):
+        self.vectors = np.vstack([self.vectors, x])
+
+    def search(self, q, k):
+        sims = self.vectors @ q[0]
+        order = np.argsort(-sims, kind="stable")[:k]
+        return sims[order][None], order[None]
+
+class _KeyedEncoder:
+    """Gives each first word its own axis, so texts sharing a first word are near-duplicates."""
+    def __init__(self):
+        self.axes = {}
+
+    def encode(self, texts, normalize_embeddings=True):
+        words = texts[0].split()
+        v = np.zeros(64, dtype="float32")
+        v[self.axes.setdefault(words[0], len(self.axes))] = 1.0
+        v[63] = 0.05 * len(words)
+        return (v / np.linalg.norm(v))[None]
+
+@pytest.fixture(autouse=True)
+def fake_faiss(monkeypatch):
+    monkeypatch.setitem(sys.modules, "faiss", types.SimpleNamespace(IndexFlatIP=_FlatIP))
+    monkeypatch.setitem(semantic_cache._ENCODERS, "test-encoder", _KeyedEncoder())
+
+def _cache(tmp_path, **kwargs):
+    return SemanticCache(path=str(tmp_path / "cache.json"), model_name="test-encoder", **kwargs)
+
+def test_in_memory_backend_expires_entries():
+    async def main():
+        backend = InMemoryBackend()
+        await backend.set("k", {"v": 1}, ttl=0)
+        await backend.set("fresh", {"v": 2}, ttl=60)
+        await asyncio.sleep(0.01)
+        return await backend.get("k"), await backend.get("fresh")
+
+    assert asyncio.run(main()) == (None, {"v": 2})
+
+def test_llm_cache_exact_then_semantic_hit(tmp_path):
+    cache = LLMCache("m", backend=InMemoryBackend(), semantic=_cache(tmp_path), ttl=60, scope="router")
+
+    async def main():
+        await cache.set("login fails", {"next_agent": "tech_specialist"})
+        exact, _ = await cache.get("  LOGIN   fails ")
+        near, _ = await cache.get("login fails again")
+        other, _ = await cache.get("refund please")
+        return exact, near, other
+
+    exact, near, other = asyncio.run(main())
+    assert exact == near == {"next_agent": "tech_specialist"}
+    assert other is None
+
+def test_llm_cache_semantic_hit_respects_ttl(tmp_path, monkeypatch):
+    cache = LLMCache("m", backend=InMemoryBackend(), semantic=_cache(tmp_path), ttl=60, scope="router")
+    now = time.time()
+
+    async def main():
+        await cache.set("login fails", {"next_agent": "tech_specialist"})
+        monkeypatch.setattr(semantic_cache.time, "time", lambda: now + 120)
+        stale, _ = await cache.get("login fails again")
+        # A fresh entry behind the expired one is still found
+        await cache.set("login broken", {"next_agent": "general_support"})
+        fresh, _ = await cache.get("login fails again")
+        return stale, fresh
+
+    stale, fresh = asyncio.run(main())
+    assert stale is None
+    assert fresh == {"next_agent": "general_support"}
+
+def test_lookup_accept_predicate_can_reject(tmp_path):
+    cache = _cache(tmp_path)
+    cache.add("s", cache.embed("login fails"), {"value": 1})
+    assert cache.lookup("s", cache.embed("login fails"), accept=lambda e: False) is None
+    assert cache.lookup("s", cache.embed("login fails"))["value"] == 1
+    assert cache.lookup("other-scope", cache.embed("login fails")) is None
+
+def test_full_scope_evicts_expired_then_oldest(tmp_path):
+    cache = _cache(tmp_path, max_entries=10)
+    for i in range(10):
+        expires = {"expires_at": time.time() - 1} if i in (2, 5) else {}
+        cache.add("s", cache.embed(f"word{i} x"), {"value": i, **expires})
+
+    cache.add("s", cache.embed("word10 x"), {"value": 10})
+    assert [e["value"] for e in cache._entries["s"]] == [0, 1, 3, 4, 6, 7, 8, 9, 10]
+
+    cache.add("s", cache.embed("word11 x"), {"value": 11})
+    cache.add("s", cache.embed("word12 x"), {"value": 12})
+    entries = cache._entries["s"]
+    assert len(entries) <= 10 and entries[-1]["value"] == 12 and entries[0]["value"] != 0
+    assert cache._indexes["s"].ntotal == len(entries) == len(cache._vectors["s"])
+    # The rebuilt index still maps hits to the right entries
+    assert cache.lookup("s", cache.embed("word12 x"))["value"] == 12
+    assert cache.lookup("s", cache.embed("word8 x"))["value"] == 8
+
+def test_save_and_load_drop_expired_entries(tmp_path):
+    cache = _cache(tmp_path)
+    cache.add("router", cache.embed("login fails"), {"value": "live", "expires_at": time.time() + 60})
+    cache.add("router", cache.embed("refund please"), {"value": "dead", "expires_at": time.time() - 1})
+    cache.add("replies", cache.embed("hello there"), {"value": "no expiry"})
+    cache.save()
+
+    with open(cache.path) as f:
+        payload = json.load(f)
+    assert [e["value"] for e in payload["router"]["entries"]] == ["live"]
+    assert len(payload["router"]["vectors"]) == 1
+
+    payload["router"]["entries"][0]["expires_at"] = time.time() - 1
+    with open(cache.path, "w") as f:
+        json.dump(payload, f)
+    reloaded = _cache(tmp_path)
+    assert "router" not in reloaded._entries
+    assert reloaded.lookup("replies", reloaded.embed("hello there"))["value"] == "no expiry"
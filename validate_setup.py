@@ -1,10 +1,21 @@
 # validate_setup.py
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
+@lru_cache(maxsize=1)
+def _get_llm(api_key: str) -> ChatOpenAI:
+    # The probe only needs "OK", so cap the reply length
+    return ChatOpenAI(
+        model="deepseek-chat",
+        openai_api_key=api_key,
+        openai_api_base="https://api.deepseek.com/v1",
+        max_tokens=4
+    )
+
 def validate():
     api_key = os.getenv("DEEPSEEK_API_KEY")
     if not api_key or api_key == "your_deepseek_api_key_here":
@@ -14,12 +25,8 @@ def validate():
     print("✅ DEEPSEEK_API_KEY found.")
     
     try:
-        llm = ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key=api_key,
-            openai_api_base="https://api.deepseek.com/v1"
-        )
-        res = llm.invoke("Test connection. Reply with 'OK'.")
+        llm = _get_llm(api_key)
+        res = llm.invoke("Test connection. Reply with 'OK'.", stop=["\n"])
         print(f"✅ LLM Response: {res.content}")
         return True
     except Exception as e: